@@ -0,0 +1,178 @@
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from logging import Logger
+from kink import inject
+from data_generator import SyntheticDataGenerator
+
+
+@inject()
+class BenchmarkRunner:
+    """Runs the pipeline stages on generated inputs, one subprocess per stage, and keeps every run's results.
+
+    Stages run their own `core/main.py` against the generated data (`DATA_PATH`), so the numbers are the ones of
+    a real run: wall time and peak RSS of the stage process, input rows per second, and the spans of the profile
+    the stage writes. Each run is saved under `<benchmark_path>/results` and compared with the previous one.
+    """
+
+    SOURCE_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    DEFAULT_HYPERPARAMETERS = {
+        "loss_function": ["YetiRank"],
+        "depth": [6],
+        "l2_leaf_reg": [8],
+        "learning_rate": [0.06],
+        "iterations": [500],
+    }
+
+    def __init__(self, logger: Logger, generator: SyntheticDataGenerator, benchmark_path: str, stages: list, stage_runner: str = "python", hyperparameters_path: str | None = None, regression_threshold: float = 0.1) -> None:
+        self.logger = logger
+        self.generator = generator
+        self.benchmark_path = benchmark_path
+        self.stages = stages
+        self.stage_runner = stage_runner
+        self.hyperparameters_path = hyperparameters_path
+        self.regression_threshold = regression_threshold
+
+    def get_hyperparameters(self) -> dict:
+        if not self.hyperparameters_path:
+            return self.DEFAULT_HYPERPARAMETERS
+        with open(self.hyperparameters_path, "r") as f:
+            return json.load(f)
+
+    def stage_command(self) -> list:
+        if self.stage_runner == "uv":
+            # every stage in its own locked environment
+            return ["uv", "run", "--frozen", "--no-dev", "python", "core/main.py"]
+        return [sys.executable, "core/main.py"]
+
+    def stage_env(self, stage: str, data_path: str) -> dict:
+        env = {**os.environ, "DATA_PATH": data_path}
+        if stage == "inference":
+            models = sorted(glob.glob(f"{data_path}/models/*-student.cbm")) or sorted(glob.glob(f"{data_path}/models/*.cbm"))
+            env.setdefault("MODEL_NAME", os.path.basename(models[0]).removesuffix(".cbm") if models else "")
+        return env
+
+    def run_stage(self, stage: str, data_path: str) -> dict:
+        profile_file = f"{data_path}/metrics/profile-{stage}.json"
+        if os.path.exists(profile_file):
+            os.remove(profile_file)
+
+        started = time.perf_counter()
+        with open(f"{data_path}/logs/{stage}.log", "w") as log:
+            process = subprocess.Popen(self.stage_command(), cwd=f"{self.SOURCE_PATH}/{stage}", env=self.stage_env(stage, data_path), stdout=log, stderr=subprocess.STDOUT)
+            # wait4 gives the peak RSS of this stage alone, process pools of the stage included once they are reaped
+            _, status, usage = os.wait4(process.pid, 0)
+        wall_seconds = time.perf_counter() - started
+
+        profile = {}
+        if os.path.exists(profile_file):
+            with open(profile_file, "r") as f:
+                profile = json.load(f)
+        spans = profile.get("spans", {})
+        # partitioned processing workers read the events themselves
+        input_rows = sum(span["rows"] for name, span in spans.items() if name.startswith(("repository.read", "partition.map")))
+
+        return {
+            "returncode": os.waitstatus_to_exitcode(status),
+            "wall_seconds": wall_seconds,
+            "peak_rss_mb": usage.ru_maxrss / (1 << 20) if sys.platform == "darwin" else usage.ru_maxrss / (1 << 10),
+            "input_rows": input_rows,
+            "rows_per_second": input_rows / wall_seconds if wall_seconds else None,
+            "spans": spans,
+        }
+
+    def run_scale(self, events: int, categories: int) -> dict:
+        data_path = self.generator.generate(f"{self.benchmark_path}/data", events, categories)
+        for folder in ("models", "metrics", "logs"):
+            os.makedirs(f"{data_path}/{folder}", exist_ok=True)
+        with open(f"{data_path}/input/hyperparameters.json", "w") as f:
+            json.dump(self.get_hyperparameters(), f, indent=4)
+
+        stages = {}
+        for stage in self.stages:
+            self.logger.info(f"[Benchmark]: Running {stage} on {events} events")
+            stages[stage] = self.run_stage(stage, data_path)
+            self.logger.info(f"[Benchmark]: {stage}: {stages[stage]['wall_seconds']:.2f}s, peak RSS {stages[stage]['peak_rss_mb']:.0f}MB, exit code {stages[stage]['returncode']}")
+            if stages[stage]["returncode"] != 0:
+                # later stages read what this one writes, their numbers would be meaningless
+                self.logger.error(f"[Benchmark]: {stage} failed, see {data_path}/logs/{stage}.log")
+                break
+
+        wall_seconds = sum(stage["wall_seconds"] for stage in stages.values())
+        return {
+            "events": events,
+            "categories": categories,
+            "wall_seconds": wall_seconds,
+            "events_per_second": events / wall_seconds if wall_seconds else None,
+            "stages": stages,
+        }
+
+    def get_commit(self) -> str | None:
+        try:
+            return subprocess.run(["git", "rev-parse", "HEAD"], cwd=self.SOURCE_PATH, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def get_baseline(self) -> dict | None:
+        results = sorted(glob.glob(f"{self.benchmark_path}/results/*.json"))
+        if not results:
+            return None
+        with open(results[-1], "r") as f:
+            return json.load(f)
+
+    def compare(self, baseline: dict, scales: list) -> list:
+        """Wall time and peak RSS ratios against the baseline run, for every stage of every scale both runs share."""
+        baseline_scales = {(scale["events"], scale["categories"]): scale for scale in baseline["scales"]}
+        comparison = []
+        for scale in scales:
+            previous = baseline_scales.get((scale["events"], scale["categories"]))
+            if previous is None:
+                continue
+            for stage, result in scale["stages"].items():
+                previous_result = previous["stages"].get(stage)
+                if previous_result is None or previous_result["returncode"] or result["returncode"]:
+                    continue
+                wall_ratio = result["wall_seconds"] / previous_result["wall_seconds"]
+                rss_ratio = result["peak_rss_mb"] / previous_result["peak_rss_mb"]
+                comparison.append({
+                    "events": scale["events"],
+                    "categories": scale["categories"],
+                    "stage": stage,
+                    "wall_ratio": wall_ratio,
+                    "peak_rss_ratio": rss_ratio,
+                    "regression": wall_ratio > 1 + self.regression_threshold or rss_ratio > 1 + self.regression_threshold,
+                })
+        return comparison
+
+    def run(self, scales: list, categories: int) -> dict:
+        baseline = self.get_baseline()
+        results = {
+            "run": time.strftime("%Y%m%dT%H%M%S"),
+            "commit": self.get_commit(),
+            "host": {"platform": platform.platform(), "cpus": os.cpu_count(), "python": platform.python_version()},
+            "seed": self.generator.seed,
+            "stage_runner": self.stage_runner,
+            "hyperparameters": self.get_hyperparameters(),
+            "scales": [self.run_scale(events, categories) for events in scales],
+        }
+
+        self.logger.info(f"[Benchmark]: Scaling curve over {categories} categories")
+        for scale in results["scales"]:
+            stage_walls = ", ".join(f"{stage} {result['wall_seconds']:.2f}s" for stage, result in scale["stages"].items())
+            self.logger.info(f"[Benchmark]: {scale['events']:>11} events: {scale['wall_seconds']:.2f}s ({stage_walls})")
+
+        if baseline is not None:
+            results["baseline"] = baseline["run"]
+            results["comparison"] = self.compare(baseline, results["scales"])
+            for entry in results["comparison"]:
+                log = self.logger.warning if entry["regression"] else self.logger.info
+                log(f"[Benchmark]: {entry['stage']} on {entry['events']} events vs {baseline['run']}: wall x{entry['wall_ratio']:.2f}, peak RSS x{entry['peak_rss_ratio']:.2f}")
+
+        os.makedirs(f"{self.benchmark_path}/results", exist_ok=True)
+        with open(f"{self.benchmark_path}/results/{results['run']}.json", "w") as f:
+            f.write(json.dumps(results, indent=4))
+        return results
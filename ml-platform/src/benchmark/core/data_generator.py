@@ -0,0 +1,136 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from logging import Logger
+from kink import inject
+
+
+@inject()
+class SyntheticDataGenerator:
+    """Seeded RetailRocket shaped inputs: `events.csv`, `item_properties_part1/2.csv` and `category_tree.csv`.
+
+    Proportions follow the public dataset: about one item per 12 events and one visitor per 2, 96.7% views,
+    2.5% add to carts and 0.8% transactions over 4.5 months, skewed item popularity and category sizes, and
+    weekly property snapshots where an item can change category. Files are written `generator_chunk_size`
+    rows at a time, so the largest scales never sit in memory.
+    """
+
+    EVENT_TYPES = np.array(["view", "addtocart", "transaction"])
+    EVENT_SHARES = [0.967, 0.025, 0.008]
+    EVENTS_PER_ITEM = 12
+    EVENTS_PER_VISITOR = 2
+    FIRST_TIMESTAMP = 1430622004384
+    LAST_TIMESTAMP = 1442545187788
+    SNAPSHOT_PERIOD = 7 * 24 * 3600 * 1000
+    PROPERTIES = ["categoryid", "available", "790", "888", "364", "283"]
+
+    def __init__(self, logger: Logger, generator_seed: int = 42, generator_chunk_size: int = 1000000) -> None:
+        self.logger = logger
+        self.seed = generator_seed
+        self.chunk_size = generator_chunk_size
+
+    def dataset_path(self, root: str, events: int, categories: int) -> str:
+        return f"{root}/{events}-{categories}-{self.seed}"
+
+    def popularity(self, rng: np.random.Generator, size: int, exponent: float) -> np.ndarray:
+        # power law weights over a random order of the ids, so popular ids are spread over the id range
+        weights = 1 / np.arange(1, size + 1) ** exponent
+        return rng.permutation(weights / weights.sum())
+
+    def generate(self, root: str, events: int, categories: int) -> str:
+        """Writes the inputs of one scale under `<root>/<events>-<categories>-<seed>/input`, reusing them when already generated."""
+        path = self.dataset_path(root, events, categories)
+        manifest = {"events": events, "categories": categories, "seed": self.seed, "items": max(events // self.EVENTS_PER_ITEM, categories)}
+        manifest_file = f"{path}/input/generator.json"
+        if os.path.exists(manifest_file):
+            with open(manifest_file, "r") as f:
+                if json.load(f) == manifest:
+                    self.logger.info(f"[Benchmark]: Reusing the inputs of {events} events over {categories} categories")
+                    return path
+
+        os.makedirs(f"{path}/input", exist_ok=True)
+        rng = np.random.default_rng(self.seed)
+        item_categories = rng.choice(categories, size=manifest["items"], p=self.popularity(rng, categories, 0.8))
+
+        self.logger.info(f"[Benchmark]: Generating {events} events over {manifest['items']} items and {categories} categories")
+        self.write_category_tree(f"{path}/input/category_tree.csv", rng, categories)
+        self.write_item_properties(f"{path}/input", rng, item_categories, categories)
+        self.write_events(f"{path}/input/events.csv", rng, events, manifest["items"])
+
+        with open(manifest_file, "w") as f:
+            json.dump(manifest, f)
+        return path
+
+    def write_category_tree(self, file: str, rng: np.random.Generator, categories: int) -> None:
+        roots = max(categories // 20, 1)
+        parents = np.where(np.arange(categories) < roots, np.nan, rng.integers(0, roots, categories))
+        pd.DataFrame({"categoryid": np.arange(categories), "parentid": pd.array(parents, dtype="Int64")}).to_csv(file, index=False)
+
+    def write_item_properties(self, path: str, rng: np.random.Generator, item_categories: np.ndarray, categories: int) -> None:
+        items = len(item_categories)
+        snapshots = (self.LAST_TIMESTAMP - self.FIRST_TIMESTAMP) // self.SNAPSHOT_PERIOD
+        items_per_chunk = max(self.chunk_size // (len(self.PROPERTIES) * 2), 1)
+
+        for part, start in enumerate(range(0, items, items_per_chunk)):
+            itemids = np.arange(start, min(start + items_per_chunk, items))
+            rows = len(itemids) * len(self.PROPERTIES)
+
+            # every item gets one row per property, a tenth of the items get a second snapshot with a new category
+            frame = pd.DataFrame({
+                "timestamp": self.FIRST_TIMESTAMP + rng.integers(0, snapshots, rows) * self.SNAPSHOT_PERIOD,
+                "itemid": np.repeat(itemids, len(self.PROPERTIES)),
+                "property": np.tile(self.PROPERTIES, len(itemids)),
+                "value": self.property_values(rng, item_categories[itemids]),
+            })
+            moved = itemids[rng.random(len(itemids)) < 0.1]
+            frame = pd.concat([frame, pd.DataFrame({
+                "timestamp": self.LAST_TIMESTAMP - rng.integers(0, snapshots, len(moved)) * self.SNAPSHOT_PERIOD,
+                "itemid": moved,
+                "property": "categoryid",
+                "value": rng.integers(0, categories, len(moved)).astype(str),
+            })])
+
+            # the public dataset is split in two files, each chunk is shared between them
+            for half, positions in enumerate(np.array_split(np.arange(len(frame)), 2)):
+                frame.iloc[positions].to_csv(f"{path}/item_properties_part{half + 1}.csv", index=False, mode="a" if part else "w", header=not part)
+
+    def property_values(self, rng: np.random.Generator, item_categories: np.ndarray) -> np.ndarray:
+        size = len(item_categories)
+        prices = np.char.add(np.char.add("n", np.round(rng.lognormal(9, 1, size), 0).astype(int).astype(str)), ".000")
+        tokens = [rng.integers(100000, 1400000, size).astype(str) for _ in range(3)]
+        values = np.column_stack([
+            item_categories.astype(str),
+            rng.integers(0, 2, size).astype(str),
+            prices,
+            np.char.add(np.char.add(tokens[0], " "), tokens[1]),
+            tokens[2],
+            np.char.add("n", rng.integers(0, 5000, size).astype(str)),
+        ])
+        return values.ravel()
+
+    def write_events(self, file: str, rng: np.random.Generator, events: int, items: int) -> None:
+        item_weights = self.popularity(rng, items, 0.9)
+        visitors = max(events // self.EVENTS_PER_VISITOR, 1)
+        chunks = -(-events // self.chunk_size)
+        transactions = 0
+
+        for chunk, start in enumerate(range(0, events, self.chunk_size)):
+            size = min(self.chunk_size, events - start)
+            # timestamps increase over the file, every chunk covers its own slice of the period
+            span = (self.LAST_TIMESTAMP - self.FIRST_TIMESTAMP) / chunks
+            timestamps = self.FIRST_TIMESTAMP + (chunk + np.sort(rng.random(size))) * span
+            event_types = rng.choice(len(self.EVENT_TYPES), size=size, p=self.EVENT_SHARES)
+
+            is_transaction = event_types == 2
+            transaction_ids = np.full(size, np.nan)
+            transaction_ids[is_transaction] = transactions + np.arange(is_transaction.sum())
+            transactions += int(is_transaction.sum())
+
+            pd.DataFrame({
+                "timestamp": timestamps.astype(np.int64),
+                "visitorid": rng.integers(0, visitors, size),
+                "event": self.EVENT_TYPES[event_types],
+                "itemid": rng.choice(items, size=size, p=item_weights),
+                "transactionid": pd.array(transaction_ids, dtype="Int64"),
+            }).to_csv(file, index=False, mode="a" if chunk else "w", header=not chunk)
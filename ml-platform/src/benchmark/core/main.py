@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+
+import os
+from kink import di
+from logging import Logger
+from benchmark_runner import BenchmarkRunner
+from data_generator import SyntheticDataGenerator
+from logger import LoggerFactory
+
+LOGLEVEL = os.getenv('LOGLEVEL')
+BENCH_PATH = os.getenv('BENCH_PATH')
+BENCH_SCALES = os.getenv('BENCH_SCALES')
+BENCH_CATEGORIES = os.getenv('BENCH_CATEGORIES')
+BENCH_STAGES = os.getenv('BENCH_STAGES')
+BENCH_RUNNER = os.getenv('BENCH_RUNNER')
+BENCH_HYPERPARAMETERS = os.getenv('BENCH_HYPERPARAMETERS')
+BENCH_REGRESSION_THRESHOLD = os.getenv('BENCH_REGRESSION_THRESHOLD')
+GENERATOR_SEED = os.getenv('GENERATOR_SEED')
+GENERATOR_CHUNK_SIZE = os.getenv('GENERATOR_CHUNK_SIZE')
+
+di[Logger] = LoggerFactory.create_logger(LOGLEVEL or "INFO")
+di["generator_seed"] = int(GENERATOR_SEED or 42)
+di["generator_chunk_size"] = int(GENERATOR_CHUNK_SIZE or 1000000)
+di["benchmark_path"] = os.path.abspath(BENCH_PATH or '../../../benchmarks')
+di["stages"] = (BENCH_STAGES or "processing,training,inference").split(",")
+di["stage_runner"] = BENCH_RUNNER or "python"
+di["hyperparameters_path"] = BENCH_HYPERPARAMETERS
+di["regression_threshold"] = float(BENCH_REGRESSION_THRESHOLD or 0.1)
+
+def main():
+    runner = BenchmarkRunner()
+    runner.run([int(float(scale)) for scale in (BENCH_SCALES or "1e5,1e6").split(",")], int(BENCH_CATEGORIES or 1669))
+
+if __name__ == "__main__":
+    main()
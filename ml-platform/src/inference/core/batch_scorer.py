@@ -0,0 +1,37 @@
+from logging import Logger
+from kink import inject
+from fs_repository_interface import FileSystemRepository
+from model_cache import ModelCache
+from model_features import prepare_features
+from profiler import Profiler
+
+
+@inject()
+class BatchScorer:
+    ID_COLUMN = "itemid"
+    PREDICTION_LABEL = "pred_score"
+
+    def __init__(self, repository: FileSystemRepository, logger: Logger, model_cache: ModelCache, profiler: Profiler, batch_chunk_size: int = 100000) -> None:
+        self.repository = repository
+        self.logger = logger
+        self.profiler = profiler
+        self.model_cache = model_cache
+        self.batch_chunk_size = batch_chunk_size
+
+    def score(self, model_name: str, dataset: str, output: str) -> int:
+        """Streams `dataset` through the model chunk by chunk, every scored chunk is written as its own part under `output`."""
+        ranking_model = self.model_cache.get(model_name)
+        columns = list(dict.fromkeys([self.ID_COLUMN, *ranking_model.feature_names_]))
+        self.logger.info(f"[Inference]: Scoring {dataset} with {model_name} in chunks of {self.batch_chunk_size} rows")
+
+        rows = 0
+        for part, chunk in enumerate(self.repository.read_chunks(dataset, self.batch_chunk_size, columns=columns)):
+            with self.profiler.span("predict", len(chunk)):
+                chunk[self.PREDICTION_LABEL] = ranking_model.predict(prepare_features(chunk, ranking_model))
+            self.repository.save(chunk[[self.ID_COLUMN, self.PREDICTION_LABEL]], f"{output}/part-{part:05d}")
+
+            rows += len(chunk)
+            self.logger.debug(f"[Inference]: Scored part {part}, {rows} rows so far")
+
+        self.logger.info(f"[Inference]: Scored {rows} rows of {dataset} into {output}")
+        return rows
@@ -0,0 +1,87 @@
+import pandas as pd
+import numpy as np
+from kink import inject
+import json
+import os
+import shutil
+from typing import Iterator
+from catboost import CatBoostRanker
+from dataset_schema import resolve_schema
+from storage_format import resolve_storage_format
+
+
+@inject()
+class FileSystemRepository():
+    INDEX_MANIFEST = "manifest.json"
+
+    def __init__(self, input_path: str, output_path: str, model_path: str, storage_format: str = "parquet", index_path: str | None = None) -> None:
+        self.input_path = input_path
+        self.output_path = output_path
+        self.model_path = model_path
+        self.storage_format = storage_format
+        self.index_path = index_path or f'{output_path}/index'
+
+    def save(self, data: pd.DataFrame, path: str, index: bool = False) -> None:
+        data = resolve_schema(path).apply(data.reset_index() if index else data, strict=True)
+        path, storage_format = resolve_storage_format(path, self.storage_format)
+        os.makedirs(os.path.dirname(f'{self.output_path}/{path}'), exist_ok=True)
+        storage_format.write(data, f'{self.output_path}/{path}', index=False)
+
+    def read(self, path: str, columns: list | None = None, filters: list | None = None) -> pd.DataFrame:
+        schema = resolve_schema(path)
+        path, storage_format = resolve_storage_format(path, self.storage_format)
+        return schema.apply(storage_format.read(f'{self.input_path}/{path}', columns=columns, filters=filters, dtypes=schema.dtypes))
+
+    def read_groups(self, path: str) -> pd.DataFrame | None:
+        """Group boundaries written alongside a dataset sorted by group, None when the dataset has no group layout."""
+        path, storage_format = resolve_storage_format(f'{path}.groups', self.storage_format)
+        if not os.path.exists(f'{self.input_path}/{path}'):
+            return None
+        return storage_format.read(f'{self.input_path}/{path}')
+
+    def read_chunks(self, path: str, chunksize: int, columns: list | None = None) -> Iterator[pd.DataFrame]:
+        schema = resolve_schema(path)
+        path, storage_format = resolve_storage_format(path, self.storage_format)
+        chunks = storage_format.read_chunks(f'{self.input_path}/{path}', chunksize, columns=columns, dtypes=schema.dtypes)
+        return (schema.apply(chunk) for chunk in chunks)
+
+    def load_model(self, filename: str) -> CatBoostRanker:
+        return CatBoostRanker().load_model(f"{self.model_path}/{filename}.cbm", format="cbm")
+
+    def get_model_signature(self, filename: str) -> str:
+        stat = os.stat(f"{self.model_path}/{filename}.cbm")
+        return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+    def save_index(self, name: str, version: str, arrays: dict, categories: list) -> None:
+        directory = f'{self.index_path}/{name}/{version}'
+        os.makedirs(directory, exist_ok=True)
+        for array_name, array in arrays.items():
+            np.save(f'{directory}/{array_name}.npy', array)
+        with open(f'{directory}/categories.json', 'w') as outfile:
+            outfile.write(json.dumps(categories))
+
+    def read_index(self, name: str, version: str) -> tuple[dict, list]:
+        # arrays are memory mapped, only the pages of the categories looked up are read
+        directory = f'{self.index_path}/{name}/{version}'
+        arrays = {
+            file.removesuffix('.npy'): np.load(f'{directory}/{file}', mmap_mode='r')
+            for file in os.listdir(directory) if file.endswith('.npy')
+        }
+        with open(f'{directory}/categories.json', 'r') as f:
+            return arrays, json.load(f)
+
+    def delete_index(self, name: str, version: str) -> None:
+        shutil.rmtree(f'{self.index_path}/{name}/{version}', ignore_errors=True)
+
+    def get_index_manifest(self, name: str) -> dict:
+        if not os.path.exists(f'{self.index_path}/{name}/{self.INDEX_MANIFEST}'):
+            return {}
+        with open(f'{self.index_path}/{name}/{self.INDEX_MANIFEST}', 'r') as f:
+            return json.load(f)
+
+    def save_index_manifest(self, name: str, manifest: dict) -> None:
+        # replaced atomically, readers see either the previous version or the new one
+        manifest_file = f'{self.index_path}/{name}/{self.INDEX_MANIFEST}'
+        with open(f'{manifest_file}.tmp', 'w') as outfile:
+            outfile.write(json.dumps(manifest, indent=4))
+        os.replace(f'{manifest_file}.tmp', manifest_file)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+import os
+import asyncio
+from kink import di
+from logging import Logger
+from batch_scorer import BatchScorer
+from ranking_service import RankingService
+from topk_index import TopKIndexBuilder
+from fs_repository_interface import FileSystemRepository
+from logger import LoggerFactory
+from profiler import Profiler
+
+LOGLEVEL = os.getenv('LOGLEVEL')
+DATA_PATH = os.getenv('DATA_PATH')
+STORAGE_FORMAT = os.getenv('STORAGE_FORMAT')
+INFERENCE_MODE = os.getenv('INFERENCE_MODE')
+MODEL_NAME = os.getenv('MODEL_NAME')
+MODEL_CACHE_SIZE = os.getenv('MODEL_CACHE_SIZE')
+BATCH_INPUT = os.getenv('BATCH_INPUT')
+BATCH_OUTPUT = os.getenv('BATCH_OUTPUT')
+BATCH_CHUNK_SIZE = os.getenv('BATCH_CHUNK_SIZE')
+CATALOGS = os.getenv('CATALOGS')
+TOP_K = os.getenv('TOP_K')
+INDEX_TOP_K = os.getenv('INDEX_TOP_K')
+INDEX_PATH = os.getenv('INDEX_PATH')
+HOST = os.getenv('HOST')
+PORT = os.getenv('PORT')
+
+dataPath = DATA_PATH or '../../../data'
+inputPath = dataPath #'/opt/ml/processing/input/data'
+outputPath = dataPath #'/opt/ml/processing/output/data'
+modelPath = f'{dataPath}/models' #"/opt/ml/model/"
+
+di[Logger] = LoggerFactory.create_logger(LOGLEVEL or "INFO")
+di[Profiler] = Profiler("inference")
+di[FileSystemRepository] = FileSystemRepository(
+    inputPath,
+    outputPath,
+    modelPath,
+    STORAGE_FORMAT or "parquet",
+    INDEX_PATH
+)
+di[Profiler].instrument(di[FileSystemRepository], prefix="repository")
+di["model_cache_size"] = int(MODEL_CACHE_SIZE or 4)
+di["batch_chunk_size"] = int(BATCH_CHUNK_SIZE or 100000)
+di["serving_model"] = MODEL_NAME
+di["catalogs"] = (CATALOGS or "training,testing").split(",")
+di["default_top_k"] = int(TOP_K or 10)
+di["index_top_k"] = int(INDEX_TOP_K or 100)
+
+def main():
+    try:
+        if INFERENCE_MODE == "serve":
+            service = di[Profiler].instrument(RankingService(), ["load_catalog", "rank"], prefix="service")
+            service.load_catalog()
+            asyncio.run(service.serve(HOST or "0.0.0.0", int(PORT or 8080)))
+        elif INFERENCE_MODE == "index":
+            builder = TopKIndexBuilder()
+            builder.refresh(MODEL_NAME)
+        else:
+            scorer = BatchScorer()
+            scorer.score(MODEL_NAME, BATCH_INPUT or "testing", BATCH_OUTPUT or f"predictions/{MODEL_NAME}")
+    finally:
+        di[Profiler].save(f"{outputPath}/metrics")
+
+if __name__ == "__main__":
+    main()
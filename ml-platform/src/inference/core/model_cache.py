@@ -0,0 +1,37 @@
+import threading
+from collections import OrderedDict
+from kink import inject
+from catboost import CatBoostRanker
+from fs_repository_interface import FileSystemRepository
+
+
+@inject()
+class ModelCache:
+    """Loaded rankers shared by the batch scorer and the ranking service, the least recently used is evicted past `model_cache_size`."""
+
+    def __init__(self, repository: FileSystemRepository, model_cache_size: int = 4) -> None:
+        self.repository = repository
+        self.capacity = max(1, model_cache_size)
+        self.models = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, model_name: str) -> CatBoostRanker:
+        with self.lock:
+            if model_name in self.models:
+                self.models.move_to_end(model_name)
+                return self.models[model_name]
+
+        # loading happens outside the lock so a cold model does not stall requests on the cached ones
+        model = self.repository.load_model(model_name)
+
+        with self.lock:
+            model = self.models.setdefault(model_name, model)
+            self.models.move_to_end(model_name)
+            while len(self.models) > self.capacity:
+                self.models.popitem(last=False)
+
+        return model
+
+    def clear(self) -> None:
+        with self.lock:
+            self.models.clear()
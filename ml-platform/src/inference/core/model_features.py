@@ -0,0 +1,26 @@
+import pandas as pd
+from catboost import CatBoostRanker
+from fs_repository_interface import FileSystemRepository
+
+ID_COLUMN = "itemid"
+GROUPINGS = ["category"]
+
+
+def read_catalog(repository: FileSystemRepository, catalogs: list) -> pd.DataFrame:
+    """Every item of the given datasets once, ordered by item id, with categorical features as strings, the way requests name them."""
+    df = pd.concat([repository.read(catalog) for catalog in catalogs], ignore_index=True)
+    df = df.drop_duplicates(ID_COLUMN).sort_values(ID_COLUMN, ignore_index=True)
+    for column in GROUPINGS:
+        df[column] = df[column].astype(str)
+
+    return df
+
+
+def prepare_features(df: pd.DataFrame, ranking_model: CatBoostRanker) -> pd.DataFrame:
+    """Selects the features the model was fit on, categorical ones as strings, which CatBoost hashes like the categorical columns it was fit on."""
+    features = list(ranking_model.feature_names_)
+    X = df[features].copy()
+    for index in ranking_model.get_cat_feature_indices():
+        X[features[index]] = X[features[index]].astype(str)
+
+    return X
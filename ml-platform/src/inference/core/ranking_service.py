@@ -0,0 +1,144 @@
+import asyncio
+import json
+import numpy as np
+from logging import Logger
+from urllib.parse import parse_qs, urlsplit
+from kink import inject
+from fs_repository_interface import FileSystemRepository
+from model_cache import ModelCache
+from model_features import ID_COLUMN, GROUPINGS, read_catalog
+from student_scorer import StudentScorer
+from topk_index import TopKIndexBuilder
+
+
+class RequestError(Exception):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+@inject()
+class RankingService:
+    """Ranks the items of a category per request, over a catalog loaded once and split by category."""
+
+    REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+    def __init__(self, repository: FileSystemRepository, logger: Logger, model_cache: ModelCache, index_builder: TopKIndexBuilder, serving_model: str, catalogs: list, default_top_k: int = 10) -> None:
+        self.repository = repository
+        self.logger = logger
+        self.model_cache = model_cache
+        self.index_builder = index_builder
+        self.serving_model = serving_model
+        self.catalogs = catalogs
+        self.default_top_k = default_top_k
+        self.categories = {}
+        self.student_scorer = None
+        self.index = None
+
+    def load_catalog(self) -> None:
+        df = read_catalog(self.repository, self.catalogs)
+        self.categories = {category: items.reset_index(drop=True) for category, items in df.groupby(GROUPINGS[0], sort=False)}
+        self.logger.info(f"[Inference]: Catalog of {len(df)} items in {len(self.categories)} categories")
+
+        # the serving model is loaded upfront so the first request does not pay for it
+        ranking_model = self.model_cache.get(self.serving_model)
+        if StudentScorer.supports(ranking_model):
+            self.student_scorer = StudentScorer.compile(ranking_model, list(self.categories))
+            self.logger.info(f"[Inference]: Compiled {self.serving_model} into {self.student_scorer.scores.shape} score lookups")
+
+        self.index = self.index_builder.open(self.serving_model)
+        if self.index is not None:
+            self.logger.info(f"[Inference]: Serving up to top {self.index.top_k} of {self.serving_model} from its index")
+
+    def rank(self, category: str, top_k: int | None = None, model_name: str | None = None) -> list[dict]:
+        items = self.categories.get(category)
+        if items is None:
+            raise RequestError(404, f"unknown category {category}")
+
+        top_k = top_k or self.default_top_k
+        if self.index is not None and model_name in (None, self.serving_model) and top_k <= self.index.top_k:
+            indexed = self.index.lookup(category, top_k)
+            if indexed is not None:
+                return [{ID_COLUMN: int(item), "score": float(score)} for item, score in zip(*indexed)]
+
+        if self.student_scorer is not None and model_name in (None, self.serving_model):
+            scores = self.student_scorer.score_category(category, items[self.student_scorer.value_feature].to_numpy())
+        else:
+            ranking_model = self.model_cache.get(model_name or self.serving_model)
+            scores = ranking_model.predict(items[ranking_model.feature_names_])
+
+        top_k = min(top_k, len(scores))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        return [{ID_COLUMN: int(item), "score": float(score)} for item, score in zip(items[ID_COLUMN].to_numpy()[top], scores[top])]
+
+    def handle(self, method: str, target: str) -> tuple[int, dict]:
+        if method != "GET":
+            raise RequestError(405, f"unsupported method {method}")
+
+        url = urlsplit(target)
+        if url.path == "/health":
+            return 200, {"status": "ok", "categories": len(self.categories)}
+        if url.path != "/rank":
+            raise RequestError(404, f"unknown path {url.path}")
+
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if "category" not in query:
+            raise RequestError(400, "category is required")
+        try:
+            top_k = int(query["k"]) if "k" in query else None
+        except ValueError:
+            raise RequestError(400, f"invalid k {query['k']}")
+        if top_k is not None and top_k < 1:
+            raise RequestError(400, f"invalid k {top_k}")
+
+        items = self.rank(query["category"], top_k, query.get("model"))
+        return 200, {"category": query["category"], "model": query.get("model", self.serving_model), "items": items}
+
+    async def respond(self, writer: asyncio.StreamWriter, status: int, payload: dict, keep_alive: bool) -> None:
+        body = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {self.REASONS[status]}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            # connections are kept alive between requests, as HTTP/1.1 clients expect
+            while request_line := await reader.readline():
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip().lower()
+                if int(headers.get("content-length", 0)):
+                    await reader.readexactly(int(headers["content-length"]))
+
+                keep_alive = headers.get("connection", "keep-alive" if version == "HTTP/1.1" else "close") == "keep-alive"
+                try:
+                    # scoring runs off the event loop, so slow teacher requests do not hold back the others
+                    status, payload = await loop.run_in_executor(None, self.handle, method, target)
+                except RequestError as error:
+                    status, payload = error.status, {"error": str(error)}
+                except Exception as error:
+                    self.logger.exception(f"[Inference]: Failed serving {target}")
+                    status, payload = 500, {"error": str(error)}
+
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ValueError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int) -> None:
+        server = await asyncio.start_server(self.serve_connection, host, port)
+        self.logger.info(f"[Inference]: Serving {self.serving_model} on {host}:{port}")
+        async with server:
+            await server.serve_forever()
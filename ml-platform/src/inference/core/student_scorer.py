@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+from catboost import CatBoostRanker
+
+
+class StudentScorer:
+    """Array evaluator of a ranker fit on one categorical and one float feature (the student's category and price).
+
+    With the category fixed, every tree split on the float feature only depends on which border interval the
+    value falls in, so the model reduces to a score per (category, price bucket). The table is built with one
+    `predict` over a representative value of every bucket, which keeps the scores identical to `predict`.
+    """
+
+    def __init__(self, value_feature: str, categories: np.ndarray, borders: np.ndarray, scores: np.ndarray) -> None:
+        self.value_feature = value_feature
+        self.categories = categories
+        self.category_index = {category: index for index, category in enumerate(categories)}
+        self.borders = borders
+        # one column per bucket plus a last one for missing values
+        self.scores = scores
+
+    @staticmethod
+    def supports(ranking_model: CatBoostRanker) -> bool:
+        return len(ranking_model.feature_names_) == 2 and len(ranking_model.get_cat_feature_indices()) == 1
+
+    @classmethod
+    def compile(cls, ranking_model: CatBoostRanker, categories) -> "StudentScorer":
+        category_feature = ranking_model.get_cat_feature_indices()[0]
+        value_feature = 1 - category_feature
+        categories = np.asarray(pd.unique(np.asarray(categories, dtype=str)))
+
+        # CatBoost compares float32 values against the borders, a split goes right when value > border
+        borders = np.asarray(ranking_model.get_borders().get(value_feature, []), dtype=np.float32)
+        representatives = np.r_[borders, np.nextafter(borders[-1], np.float32(np.inf)) if len(borders) else np.float32(0), np.nan]
+
+        grid = pd.DataFrame({
+            ranking_model.feature_names_[category_feature]: np.repeat(categories, len(representatives)),
+            ranking_model.feature_names_[value_feature]: np.tile(representatives, len(categories)),
+        })[ranking_model.feature_names_]
+        scores = ranking_model.predict(grid).reshape(len(categories), len(representatives))
+
+        return cls(ranking_model.feature_names_[value_feature], categories, borders, scores)
+
+    def buckets(self, values) -> np.ndarray:
+        values = np.asarray(values, dtype=np.float32)
+        return np.where(np.isnan(values), len(self.borders) + 1, np.searchsorted(self.borders, values, side="left"))
+
+    def category_scores(self, category: str) -> tuple[np.ndarray, np.ndarray]:
+        """Price bucket to score lookup of one category: bucket i holds the prices in (borders[i-1], borders[i]]."""
+        return self.borders, self.scores[self.category_index[category], :-1]
+
+    def score_category(self, category: str, values) -> np.ndarray:
+        return self.scores[self.category_index[category], self.buckets(values)]
+
+    def score(self, categories, values) -> np.ndarray:
+        """Scores a batch of (category, value) pairs, categories unknown to the table score as NaN."""
+        rows = pd.Series(np.asarray(categories, dtype=str)).map(self.category_index)
+        known = rows.notna().to_numpy()
+        scores = np.full(len(known), np.nan)
+        scores[known] = self.scores[rows[known].to_numpy(dtype=int), self.buckets(values)[known]]
+        return scores
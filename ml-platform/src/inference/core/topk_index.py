@@ -0,0 +1,155 @@
+import time
+import numpy as np
+import pandas as pd
+from logging import Logger
+from kink import inject
+from fs_repository_interface import FileSystemRepository
+from model_cache import ModelCache
+from model_features import ID_COLUMN, GROUPINGS, read_catalog
+from student_scorer import StudentScorer
+from profiler import Profiler
+
+
+class TopKIndex:
+    """Top items of every category, stored back to back with the offsets of each category's segment.
+
+    `items[offsets[slot]:offsets[slot + 1]]` are the items of the category in `slot`, best first.
+    """
+
+    def __init__(self, categories: list, offsets: np.ndarray, items: np.ndarray, scores: np.ndarray, top_k: int) -> None:
+        self.slots = {category: slot for slot, category in enumerate(categories)}
+        self.offsets = offsets
+        self.items = items
+        self.scores = scores
+        self.top_k = top_k
+
+    def lookup(self, category: str, top_k: int | None = None) -> tuple[np.ndarray, np.ndarray] | None:
+        slot = self.slots.get(category)
+        if slot is None:
+            return None
+
+        start, end = int(self.offsets[slot]), int(self.offsets[slot + 1])
+        end = min(end, start + (top_k or self.top_k))
+        return self.items[start:end], self.scores[start:end]
+
+
+def top_k_segments(categories: np.ndarray, scores: np.ndarray, top_k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Row order of the best `top_k` rows of every category, with the category of each kept row, grouped by category."""
+    order = np.lexsort((-scores, categories))
+    sorted_categories = categories[order]
+    starts = np.flatnonzero(np.r_[True, sorted_categories[1:] != sorted_categories[:-1]])
+    positions = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    kept = order[positions < top_k]
+    return kept, categories[kept]
+
+
+@inject()
+class TopKIndexBuilder:
+    def __init__(self, repository: FileSystemRepository, logger: Logger, model_cache: ModelCache, profiler: Profiler, catalogs: list, index_top_k: int = 100) -> None:
+        self.repository = repository
+        self.logger = logger
+        self.profiler = profiler
+        self.model_cache = model_cache
+        self.catalogs = catalogs
+        self.index_top_k = index_top_k
+
+    def open(self, model_name: str) -> TopKIndex | None:
+        manifest = self.repository.get_index_manifest(model_name)
+        if not manifest:
+            return None
+        if manifest["signature"] != self.repository.get_model_signature(model_name):
+            self.logger.warning(f"[Inference]: Top-K index of {model_name} was built with another model file, ignoring it")
+            return None
+
+        arrays, categories = self.repository.read_index(model_name, manifest["version"])
+        return TopKIndex(categories, arrays["offsets"], arrays["items"], arrays["scores"], manifest["top_k"])
+
+    def score(self, ranking_model, catalog: pd.DataFrame) -> np.ndarray:
+        if StudentScorer.supports(ranking_model):
+            student_scorer = StudentScorer.compile(ranking_model, catalog[GROUPINGS[0]].unique())
+            return student_scorer.score(catalog[GROUPINGS[0]].to_numpy(), catalog[student_scorer.value_feature].to_numpy())
+
+        return ranking_model.predict(catalog[ranking_model.feature_names_])
+
+    def changed_categories(self, previous: dict, previous_categories: list, items: np.ndarray, fingerprints: np.ndarray, categories: np.ndarray) -> set:
+        """Categories holding an item that was added, removed or had one of its features changed since the previous index."""
+        previous_items = previous["catalog_items"]
+
+        positions = np.minimum(np.searchsorted(previous_items, items), len(previous_items) - 1)
+        changed = (previous_items[positions] != items) | (previous["catalog_fingerprints"][positions] != fingerprints)
+
+        previous_positions = np.minimum(np.searchsorted(items, previous_items), len(items) - 1)
+        previous_changed = (items[previous_positions] != previous_items) | (fingerprints[previous_positions] != previous["catalog_fingerprints"])
+
+        # an item moving to another category changes its fingerprint, so both categories get refreshed
+        return set(categories[changed]) | set(np.asarray(previous_categories)[previous["catalog_slots"][previous_changed]])
+
+    def refresh(self, model_name: str) -> TopKIndex:
+        """Builds the top-K index of the model over the catalog, re-scoring only the categories changed since the last build."""
+        ranking_model = self.model_cache.get(model_name)
+        features = list(ranking_model.feature_names_)
+        signature = self.repository.get_model_signature(model_name)
+
+        catalog = read_catalog(self.repository, self.catalogs)
+        items = catalog[ID_COLUMN].to_numpy(dtype=np.int64)
+        categories = catalog[GROUPINGS[0]].to_numpy(dtype=str)
+        fingerprints = pd.util.hash_pandas_object(catalog[features], index=False).to_numpy()
+        index_categories = sorted(set(categories))
+
+        manifest = self.repository.get_index_manifest(model_name)
+        previous, previous_categories = None, []
+        if manifest and (manifest["signature"], manifest["features"], manifest["top_k"]) == (signature, features, self.index_top_k):
+            previous, previous_categories = self.repository.read_index(model_name, manifest["version"])
+
+        if previous is None or not len(previous["catalog_items"]) or not len(items):
+            touched = set(index_categories)
+        else:
+            touched = self.changed_categories(previous, previous_categories, items, fingerprints, categories)
+        self.logger.info(f"[Inference]: Re-scoring {len(touched)}/{len(index_categories)} categories of the {model_name} top-K index")
+        if not touched:
+            return self.open(model_name)
+
+        rescored = np.isin(categories, list(touched))
+        with self.profiler.span("index.score", int(rescored.sum())):
+            scores = self.score(ranking_model, catalog[rescored]) if rescored.any() else np.array([])
+        kept, kept_categories = top_k_segments(categories[rescored], scores, self.index_top_k)
+        rescored_items, rescored_scores = items[rescored][kept], scores[kept]
+        bounds = np.searchsorted(kept_categories, index_categories, side="left"), np.searchsorted(kept_categories, index_categories, side="right")
+
+        previous_slots = {category: slot for slot, category in enumerate(previous_categories)}
+        segment_items, segment_scores = [], []
+        for slot, category in enumerate(index_categories):
+            if category in touched:
+                segment_items.append(rescored_items[bounds[0][slot]:bounds[1][slot]])
+                segment_scores.append(rescored_scores[bounds[0][slot]:bounds[1][slot]])
+            else:
+                # untouched categories are copied from the previous index, without scoring
+                previous_slot = previous_slots[category]
+                start, end = previous["offsets"][previous_slot], previous["offsets"][previous_slot + 1]
+                segment_items.append(previous["items"][start:end])
+                segment_scores.append(previous["scores"][start:end])
+
+        version = f"v{manifest.get('runs', 0) + 1:06d}"
+        category_slots = np.searchsorted(index_categories, categories).astype(np.int32)
+        self.repository.save_index(model_name, version, {
+            "offsets": np.r_[0, np.cumsum([len(segment) for segment in segment_items])].astype(np.int64),
+            "items": np.concatenate(segment_items).astype(np.int64) if segment_items else np.array([], dtype=np.int64),
+            "scores": np.concatenate(segment_scores).astype(np.float64) if segment_scores else np.array([]),
+            "catalog_items": items,
+            "catalog_fingerprints": fingerprints,
+            "catalog_slots": category_slots,
+        }, index_categories)
+        self.repository.save_index_manifest(model_name, {
+            "version": version,
+            "signature": signature,
+            "features": features,
+            "top_k": self.index_top_k,
+            "runs": manifest.get("runs", 0) + 1,
+            "refreshed_categories": len(touched),
+            "created": int(time.time()),
+        })
+        if manifest and manifest["version"] != version:
+            self.repository.delete_index(model_name, manifest["version"])
+
+        self.logger.info(f"[Inference]: Top-K index {version} of {model_name}: {len(index_categories)} categories, top {self.index_top_k} items each")
+        return self.open(model_name)
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+from catboost import CatBoostRanker, Pool
+from student_scorer import StudentScorer
+
+
+@pytest.fixture(scope="module")
+def student():
+    random = np.random.default_rng(1)
+    categories = random.integers(0, 12, size=2000).astype(str)
+    prices = random.uniform(5000, 55000, size=2000).round(2)
+    labels = random.integers(0, 4, size=2000)
+    order = np.argsort(categories, kind="stable")
+    X = pd.DataFrame({"category": categories[order], "price": prices[order]})
+    pool = Pool(X, label=labels[order], group_id=categories[order], cat_features=["category"])
+    return CatBoostRanker(iterations=40, depth=4, loss_function="YetiRank", verbose=False, allow_writing_files=False, random_seed=0).fit(pool), X
+
+
+def test_scores_equal_predict(student):
+    ranking_model, X = student
+    scorer = StudentScorer.compile(ranking_model, X["category"])
+    assert StudentScorer.supports(ranking_model)
+
+    random = np.random.default_rng(2)
+    borders = scorer.borders.astype(np.float64)
+    # values on, just around and far from the borders, and missing prices
+    values = np.r_[borders, np.nextafter(scorer.borders, np.float32(np.inf)), np.nextafter(scorer.borders, np.float32(-np.inf)), random.uniform(0, 80000, size=500), [-1.0, 1e9, np.nan]]
+    categories = random.choice(X["category"].unique(), size=len(values))
+
+    expected = ranking_model.predict(pd.DataFrame({"category": categories, "price": values}))
+    np.testing.assert_array_equal(scorer.score(categories, values), expected)
+    for category in np.unique(categories):
+        in_category = categories == category
+        np.testing.assert_array_equal(scorer.score_category(category, values[in_category]), expected[in_category])
+
+
+def test_unknown_categories_score_as_missing(student):
+    ranking_model, X = student
+    scorer = StudentScorer.compile(ranking_model, X["category"])
+    scores = scorer.score(np.array(["0", "unknown"]), np.array([10000.0, 10000.0]))
+
+    assert not np.isnan(scores[0]) and np.isnan(scores[1])
@@ -1,20 +1,42 @@
-import random
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from kink import inject
 import fireducks.pandas as pd
-from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import MinMaxScaler
 from fs_repository_interface import FileSystemRepository
+from dataset_schema import resolve_schema
+from dataset_split import partition_groups, split_mask
+from partitioned_events import PartitionedEvents, aggregate_events, event_aggregations, merge_events_aggregates
+from profiler import Profiler
 from logging import Logger
 
 @inject()
 class DataPreProcessing:
 	target_label = "relevance"
 	intentions = {'view': 1, 'addtocart': 1, 'transaction': 1}
+	item_property_columns = ['timestamp', 'itemid', 'value']
+	item_properties = ['item_properties_part1.csv', 'item_properties_part2.csv']
+	item_category_property = 'categoryid'
+	event_columns = ['visitorid', 'itemid', 'event', 'timestamp']
+	raw_inputs = ['events.csv', *item_properties]
+	event_counters = {1: 'views', 2: 'favorites', 3: 'purchased'}
+	events_partitions_path = 'events'
+	events_state_max_parts = 30
+	profiled_steps = ['prepare_events', 'prepare_events_stream', 'prepare_incremental_items_stats', 'prepare_partitioned_items_stats', 'prepare_items_stats', 'read_item_categories', 'prepare_item_characteristics', 'enrich_data', 'save_split']
 
-	def __init__(self, repository: FileSystemRepository, logger: Logger):
+	def __init__(self, repository: FileSystemRepository, logger: Logger, profiler: Profiler, events_chunk_size: int = 0, incremental: bool = False, random_seed: int = 42, split_stratify: bool = True, split_partitions: int = 0, properties_chunk_size: int = 1000000, processing_workers: int = 0):
 		self.data_repository = repository
 		self.logger = logger
+		self.random_seed = random_seed
+		self.random = np.random.default_rng(random_seed)
+		self.split_stratify = split_stratify
+		self.split_partitions = split_partitions
+		self.events_chunk_size = events_chunk_size
+		self.incremental = incremental
+		self.properties_chunk_size = properties_chunk_size
+		self.processing_workers = processing_workers
+		self.profiler = profiler
+		profiler.instrument(self, self.profiled_steps, prefix='step')
 
 	def prepare_events(self, df):
 		df.loc[:, 'event_code'] = df.loc[:, 'event'].map(self.intentions).astype(int)
@@ -31,39 +53,179 @@ class DataPreProcessing:
 		self.logger.info(f"Total Visitor Events Data Shape: {df.shape}")
 
 		return df
+
+	def aggregate_events(self, df):
+		return aggregate_events(df, self.intentions, self.event_counters)
+
+	def merge_events_aggregates(self, aggregates):
+		return merge_events_aggregates(aggregates, self.event_counters)
+
+	def event_aggregations(self):
+		return event_aggregations(self.event_counters)
+
+	def finalize_events_aggregate(self, df):
+		# pairs without any event of a kind carry no counter, as in the in-memory prepare_events
+		for counter in self.event_counters.values():
+			df[counter] = df[counter].where(df[counter] > 0)
+
+		df = df.reset_index().sort_values(['visitorid', 'timestamp'])
+		df.drop(columns=['timestamp'], inplace=True)
+		df.set_index(['visitorid', 'itemid'], inplace=True)
+		return df
+
+	def aggregate_events_stream(self, chunks):
+		aggregate = None
+		pending, pending_rows = [], 0
+
+		for chunk in chunks:
+			partial = self.aggregate_events(chunk)
+			pending.append(partial)
+			pending_rows += len(partial)
+
+			# compacting once the pending partials outgrow the aggregate keeps merges amortized linear
+			if pending_rows >= max(self.events_chunk_size, len(aggregate) if aggregate is not None else 0):
+				aggregate = self.merge_events_aggregates(pending if aggregate is None else [aggregate] + pending)
+				pending, pending_rows = [], 0
+				self.logger.debug(f"Aggregated Visitor Events: {aggregate.shape}")
+
+		if pending:
+			aggregate = self.merge_events_aggregates(pending if aggregate is None else [aggregate] + pending)
+
+		return aggregate
+
+	def prepare_events_stream(self, chunks):
+		df = self.finalize_events_aggregate(self.aggregate_events_stream(chunks))
+		self.logger.info(f"Total Visitor Events Data Shape: {df.shape}")
+
+		return df
+
+	def read_event_partitions(self, partitions):
+		# partitions are only ever read once, tracked by name in the manifest, so late events of a new partition are kept whatever their timestamp
+		for partition in partitions:
+			if self.events_chunk_size:
+				yield from self.data_repository.read_chunks(partition, self.events_chunk_size, columns=self.event_columns)
+			else:
+				yield self.data_repository.read(partition, columns=self.event_columns)
+
+	def compact_events_state(self, parts, run):
+		aggregate = self.merge_events_aggregates([
+			self.data_repository.read_state(part).set_index(['visitorid', 'itemid']) for part in parts
+		])
+		# written beside the parts, they are only deleted once the manifest no longer names them
+		compacted = f"visitor_events/compacted-{run:06d}"
+		self.data_repository.save_state(aggregate, compacted, index=True)
+
+		self.logger.info(f"Compacted {len(parts)} Visitor Events State Parts: {aggregate.shape}")
+		return [compacted]
+
+	def prepare_incremental_items_stats(self):
+		manifest = self.data_repository.get_state_manifest()
+		processed = manifest.get('partitions', [])
+		parts = manifest.get('parts', [])
+
+		partitions = [
+			partition for partition in self.data_repository.list_inputs(self.events_partitions_path)
+			if partition not in processed
+		]
+		self.logger.info(f"New Event Partitions: {len(partitions)}")
+
+		# state files are never rewritten in place, a run writes new ones and commits them by saving the manifest naming them
+		run = manifest.get('runs', 0)
+		items_stats = manifest.get('items_stats', 'items_stats')
+		df_items_stats = self.data_repository.read_state(items_stats)
+		if df_items_stats is None:
+			df_items_stats = pd.DataFrame(columns=list(self.event_counters.values()), index=pd.Index([], name='itemid'))
+		else:
+			df_items_stats.set_index('itemid', inplace=True)
+
+		if not partitions:
+			return df_items_stats
+
+		delta = self.aggregate_events_stream(self.read_event_partitions(partitions))
+		obsolete = []
+		if delta is not None and len(delta):
+			part = f"visitor_events/part-{run:06d}"
+			self.data_repository.save_state(delta, part, index=True)
+			parts.append(part)
+
+			df_items_delta = delta.groupby(level='itemid')[list(self.event_counters.values())].sum()
+			df_items_stats = pd.concat([df_items_stats, df_items_delta]).groupby(level='itemid').sum()
+			obsolete.append(items_stats)
+			items_stats = f"items_stats/run-{run:06d}"
+			self.data_repository.save_state(df_items_stats, items_stats, index=True)
+
+		if len(parts) > self.events_state_max_parts:
+			obsolete.extend(parts)
+			parts = self.compact_events_state(parts, run)
+
+		self.data_repository.save_state_manifest({
+			'partitions': processed + partitions,
+			'parts': parts,
+			'items_stats': items_stats,
+			'runs': run + 1,
+		})
+		for path in obsolete:
+			self.data_repository.delete_state(path)
+		self.logger.info(f"Items Stats Data Shape: {df_items_stats.shape}")
+
+		return df_items_stats
 	
+	def prepare_partitioned_items_stats(self):
+		file, storage_format = self.data_repository.locate_input('events.csv')
+		with ProcessPoolExecutor(max_workers=self.processing_workers) as executor:
+			engine = PartitionedEvents(executor, self.profiler, self.processing_workers, self.random_seed)
+			df = engine.items_stats(file, storage_format, resolve_schema('events.csv'), self.event_columns, self.intentions, self.event_counters)
+
+		self.logger.info(f"Items Stats Data Shape: {df.shape} over {self.processing_workers} partitions")
+		return df
+
 	def prepare_items_stats(self, df):
 		df = df.groupby(['itemid']).sum()
 		self.logger.info(f"Items Stats Data Shape: {df.shape}")
 		return df
 	
+	def latest_item_values(self, df):
+		# stable on timestamp ties, the row read last wins as it would in the concatenated parts
+		return df.sort_values('timestamp', kind='stable').drop_duplicates('itemid', keep='last')
+
+	def read_item_category_part(self, path):
+		latest = None
+		chunks = self.data_repository.read_chunks(path, self.properties_chunk_size, columns=self.item_property_columns, filters=[('property', '==', self.item_category_property)])
+		for chunk in chunks:
+			# only the category rows of a chunk are kept, folded into the latest category of every item seen so far
+			latest = self.latest_item_values(chunk if latest is None else pd.concat([latest, chunk]))
+		return latest
+
+	def read_item_categories(self):
+		# the parts are parsed concurrently, the full property table is never held in memory
+		with ThreadPoolExecutor(max_workers=len(self.item_properties)) as executor:
+			parts = list(executor.map(self.read_item_category_part, self.item_properties))
+
+		df = self.latest_item_values(pd.concat(parts))
+		self.logger.info(f"Item Category Properties: {df.shape}")
+		return df
+
 	def prepare_item_characteristics(self, df):
-		df = df[df.loc[:, 'property'] == 'categoryid']
 		df['category'] = df.loc[:, 'value'].astype(int)
-		df.drop(columns=['property', 'value'], inplace=True)
+		df.drop(columns=['timestamp', 'value'], inplace=True)
 		df.set_index('itemid', inplace=True)
 		df.sort_values('itemid', inplace=True)
 		self.logger.info(f"Item Categories: {df.shape}")
-		self.logger.debug(f"All Items: \n{df.head()}")
+		self.logger.debug("All Items: \n%s", df.head())
 		return df
 
-	def assign_random_per_category(self, group, column):
-		price_step = range(1, 900, 50)
-		step = random.choice(price_step)
-		min_val = random.choice(range(5000, 54000, step))
+	def assign_random_per_category(self, df, column):
+		categories = df.groupby("category").ngroup().to_numpy()
+		groups = categories.max() + 1 if len(categories) else 0
 
-		possible_max = list(range(min_val + step, 55000, step))
-		if not possible_max:
-			possible_max = [min_val + step]
+		# price bounds drawn per category, on the same step grids as the former per-group sampling
+		step = self.random.choice(np.arange(1, 900, 50), size=groups)
+		min_val = 5000 + self.random.integers(0, -(-(54000 - 5000) // step)) * step
+		max_count = np.maximum(-(-(55000 - (min_val + step)) // step), 1)
+		max_val = min_val + step + self.random.integers(0, max_count) * step
 
-		max_val = random.choice(possible_max)
-
-		if max_val <= min_val:
-			max_val = min_val + step
-
-		items = range(min_val, max_val)
-		group[column] = np.random.choice(items, size=len(group))
-		return group
+		df[column] = self.random.integers(min_val[categories], max_val[categories])
+		return df.sort_values("category", kind="stable")
 	
 	def enrich_data(self, df):
 		weights = {
@@ -83,9 +245,9 @@ class DataPreProcessing:
 			weights["purchased"] * df['purchased']
 
 		
-		df = df.groupby("category", group_keys=False)[df.columns].apply(self.assign_random_per_category, column="price")
-		df["views_norm"] = df.groupby("category")["views"].transform( lambda x: x / (x.mean() + 1e-6) )
-		df["price_rel_cat"] = df.groupby("category")["price"].transform( lambda x: x / (x.median() + 1e-6) )
+		df = self.assign_random_per_category(df, column="price")
+		df["views_norm"] = df["views"] / (df.groupby("category")["views"].transform("mean") + 1e-6)
+		df["price_rel_cat"] = df["price"] / (df.groupby("category")["price"].transform("median") + 1e-6)
 		df['price_x_views'] = df['price'] * df['views_norm']
 		df['price_rel_cat_x_views'] = df['price_rel_cat'] * df['views_norm']
 
@@ -103,14 +265,28 @@ class DataPreProcessing:
 	def prepare(self):
 		self.logger.info(f"Starting data Processing...")
 
-		df_events = self.data_repository.read('events.csv')
-		df_items = pd.concat([ 
-			self.data_repository.read('item_properties_part1.csv').drop('timestamp', axis=1),
-			self.data_repository.read('item_properties_part2.csv').drop('timestamp', axis=1)
-		])
+		# incremental runs keep their own state of the processed events, only full runs go through the step cache
+		cache_key = None if self.incremental else self.data_repository.get_cache_key(self.raw_inputs, {
+			"random_seed": self.random_seed,
+			"split_stratify": self.split_stratify,
+			"split_partitions": self.split_partitions,
+		})
+		if cache_key and self.data_repository.restore_outputs(cache_key):
+			self.logger.info(f"Inputs unchanged since step cache entry {cache_key}, restored its outputs")
+			return
 
-		df_events = self.prepare_events(df_events)
-		df_items_stats = self.prepare_items_stats(df_events.copy(deep=True))
+		df_items = self.read_item_categories()
+
+		if self.incremental:
+			df_items_stats = self.prepare_incremental_items_stats()
+		elif self.processing_workers:
+			df_items_stats = self.prepare_partitioned_items_stats()
+		elif self.events_chunk_size:
+			df_events = self.prepare_events_stream(self.data_repository.read_chunks('events.csv', self.events_chunk_size, columns=self.event_columns))
+			df_items_stats = self.prepare_items_stats(df_events.copy(deep=True))
+		else:
+			df_events = self.prepare_events(self.data_repository.read('events.csv'))
+			df_items_stats = self.prepare_items_stats(df_events.copy(deep=True))
 		df_items = self.prepare_item_characteristics(df_items)
 
 		df_items = df_items.join(df_items_stats, how='left', lsuffix='', rsuffix='_right', on='itemid')
@@ -119,18 +295,33 @@ class DataPreProcessing:
 		df_items = self.enrich_data(df_items)
 		
 		self.logger.info(f"Final Items: {df_items.shape}")
-		self.logger.debug(f"Final Items: \n{df_items.head()}")
-
-		# Split the data into training and testing sets
-		train_set, test_set = train_test_split(
-			df_items, 
-			train_size=0.70, 
-			test_size=0.30, 
-			random_state=42
+		self.logger.debug("Final Items: \n%s", df_items.head())
+
+		# Split on item id hashes: deterministic, no shuffle, and per category when stratified
+		in_training = split_mask(
+			df_items.index.to_numpy(),
+			train_size=0.70,
+			seed=self.random_seed,
+			groups=df_items['category'].to_numpy() if self.split_stratify else None,
 		)
 
-		# Save the datasets
-		self.logger.info(f"Shape of test_set:  \n {test_set.shape}")
-		self.data_repository.save(data=test_set, path=f'testing.csv', index=True, force=True)
-		self.logger.info(f"Shape of train_set:  \n {train_set.shape}")
-		self.data_repository.save(data=train_set, path=f'training.csv', index=True, force=True)
+		self.save_split(df_items[~in_training], 'testing')
+		self.save_split(df_items[in_training], 'training')
+
+		if cache_key:
+			self.data_repository.store_outputs(cache_key)
+
+	def save_split(self, df, path):
+		# sorted by category, with the group boundaries alongside, so consumers slice groups instead of sorting
+		if self.split_partitions:
+			# every category lives in a single part, the parts read back in order stay contiguous by category
+			partitions = partition_groups(df['category'].to_numpy(), self.split_partitions, self.random_seed)
+			df = df.iloc[np.lexsort((df['category'].to_numpy(), partitions))]
+			bounds = np.searchsorted(np.sort(partitions), np.arange(self.split_partitions + 1))
+			self.data_repository.save_partitions([df.iloc[bounds[part]:bounds[part + 1]] for part in range(self.split_partitions)], path, index=True)
+		else:
+			df = df.sort_values('category', kind='stable')
+			self.data_repository.save(data=df, path=path, index=True, force=True)
+
+		self.logger.info(f"Shape of {path} set:  \n {df.shape}")
+		self.data_repository.save_groups(df, path, 'category')
@@ -0,0 +1,87 @@
+import fnmatch
+from pandas import CategoricalDtype
+
+
+class SchemaError(ValueError):
+    pass
+
+
+class DatasetSchema:
+    """Declared dtypes of the columns of a dataset: downcast integers, categorical labels and float32 features.
+
+    Integer coded labels (ex. item `category`) stay integers, parquet only keeps the dictionary type of string
+    categories, so they could not be read back as categorical anyway.
+
+    CSV inputs are parsed straight into these dtypes instead of inferring them, and every frame read or saved
+    through a repository is cast to them.
+    """
+
+    def __init__(self, name: str, dtypes: dict) -> None:
+        self.name = name
+        self.dtypes = dtypes
+
+    def apply(self, data, strict: bool = False):
+        """Casts the declared columns of `data`, with `strict` the columns a declared dataset does not declare are rejected."""
+        undeclared = [column for column in data.columns if column not in self.dtypes]
+        if strict and self.dtypes and undeclared:
+            raise SchemaError(f"Columns {undeclared} are not declared in the {self.name} schema")
+
+        casts = {column: dtype for column, dtype in self.dtypes.items() if column in data.columns and data[column].dtype != dtype}
+        if not casts:
+            return data
+        try:
+            return data.astype(casts)
+        except (TypeError, ValueError) as error:
+            raise SchemaError(f"Data does not match the {self.name} schema: {error}") from error
+
+
+EVENTS = DatasetSchema("events", {
+    "timestamp": "int64",
+    "visitorid": "int32",
+    "event": CategoricalDtype(["view", "addtocart", "transaction"], ordered=True),
+    "itemid": "int32",
+    "transactionid": "Int32",
+})
+
+ITEM_PROPERTIES = DatasetSchema("item_properties", {
+    "timestamp": "int64",
+    "itemid": "int32",
+    "property": "category",
+    "value": "str",
+})
+
+ITEMS = DatasetSchema("items", {
+    "itemid": "int32",
+    "category": "int32",
+    "views": "int32",
+    "favorites": "int32",
+    "purchased": "int32",
+    "relevance": "float32",
+    "price": "float32",
+    "views_norm": "float32",
+    "price_rel_cat": "float32",
+    "price_x_views": "float32",
+    "price_rel_cat_x_views": "float32",
+})
+
+PREDICTIONS = DatasetSchema("predictions", {
+    "itemid": "int32",
+    "pred_score": "float32",
+})
+
+# dataset paths as passed to the repositories, before the storage format extension is resolved
+SCHEMAS = {
+    "events.csv": EVENTS,
+    "events/*": EVENTS,
+    "item_properties_part*.csv": ITEM_PROPERTIES,
+    "training": ITEMS,
+    "testing": ITEMS,
+    "predictions/*": PREDICTIONS,
+}
+
+UNDECLARED = DatasetSchema("undeclared", {})
+
+
+def resolve_schema(path: str) -> DatasetSchema:
+    """Schema of a dataset path, datasets without a declared schema keep the dtypes they are read or saved with."""
+    return next((schema for pattern, schema in SCHEMAS.items() if fnmatch.fnmatch(path, pattern)), UNDECLARED)
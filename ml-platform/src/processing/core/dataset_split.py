@@ -0,0 +1,50 @@
+import numpy as np
+
+
+def hash_ids(ids, seed: int = 0) -> np.ndarray:
+    """Deterministic 64 bit hash (splitmix64) of integer ids, the same id always lands on the same value for a seed."""
+    hashes = np.asarray(ids).astype(np.int64).view(np.uint64) + np.uint64(seed * 0x9E3779B97F4A7C15 % (1 << 64))
+    hashes = (hashes ^ (hashes >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    hashes = (hashes ^ (hashes >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return hashes ^ (hashes >> np.uint64(31))
+
+
+def hash_unit(ids, seed: int = 0) -> np.ndarray:
+    """Hash of every id mapped to [0, 1)."""
+    return (hash_ids(ids, seed) >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+
+def split_mask(ids, train_size: float, seed: int = 0, groups=None) -> np.ndarray:
+    """Training membership of every row, from id hashes so a split never depends on the row order.
+
+    Without groups every row is decided on its own hash, the same id always lands in the same split and chunks
+    of a stream can be split independently. With groups, the rows of each group are ordered by hash and the
+    first round(train_size * size) go to training, so every group keeps the same share in both splits. A row then
+    depends on its rank in its group: it only keeps its split while the group keeps the same items, and the
+    whole group has to be passed at once, so streamed chunks are rejected.
+    """
+    units = hash_unit(ids, seed)
+    if groups is None:
+        return units < train_size
+
+    groups = np.asarray(groups)
+    if np.ndim(groups) != 1 or len(groups) != len(units):
+        raise ValueError("A stratified split needs the ids and groups of every row at once, streamed chunks cannot be split per group")
+
+    _, codes = np.unique(groups, return_inverse=True)
+    order = np.lexsort((units, codes))
+    sizes = np.bincount(codes)
+    starts = np.r_[0, np.cumsum(sizes)[:-1]]
+    positions = np.empty(len(order), dtype=np.int64)
+    positions[order] = np.arange(len(order)) - np.repeat(starts, sizes)
+    return positions < np.floor(sizes * train_size + 0.5)[codes]
+
+
+def partition_groups(groups, partitions: int, seed: int = 0) -> np.ndarray:
+    """Partition of every row, all rows of a group land in the same one."""
+    return (hash_ids(groups, seed) % np.uint64(partitions)).astype(np.int64)
+
+
+def partition_pairs(left, right, partitions: int, seed: int = 0) -> np.ndarray:
+    """Partition of every (left, right) id pair, all rows of a pair land in the same one."""
+    return partition_groups(hash_ids(left, seed) ^ np.asarray(right).astype(np.int64).view(np.uint64), partitions, seed)
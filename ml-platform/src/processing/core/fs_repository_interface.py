@@ -1,16 +1,128 @@
+import json
+import os
+import shutil
 import fireducks.pandas as pd
 from kink import inject
+from typing import Iterator
+from dataset_schema import resolve_schema
+from storage_format import STORAGE_FORMATS, StorageFormat, group_layout, resolve_storage_format
+from step_cache import StepCache
 
 @inject()
 class FileSystemRepository():
-    def __init__(self, input_path: str, output_path: str, analysis: bool = False) -> None:
+    STATE_MANIFEST = "manifest.json"
+
+    def __init__(self, input_path: str, output_path: str, analysis: bool = False, storage_format: str = "parquet", state_path: str | None = None, step_cache: StepCache | None = None) -> None:
         self.input_path = input_path
         self.output_path = output_path
         self.analysis = analysis
+        self.storage_format = storage_format
+        self.state_path = state_path or f'{output_path}/state'
+        self.step_cache = step_cache
+        # every output written by this run, stored together in the step cache
+        self.outputs = []
+
+    def remove_output(self, file: str) -> None:
+        if os.path.isdir(file):
+            shutil.rmtree(file)
+        elif os.path.exists(file):
+            os.remove(file)
+
+    def remove_stale_groups(self, path: str) -> None:
+        # a group layout left by an earlier run describes rows this run no longer writes, save_groups writes the new one
+        if not path.endswith('.groups'):
+            for extension in STORAGE_FORMATS:
+                self.remove_output(f'{self.output_path}/{path}.groups.{extension}')
 
     def save(self, data: pd.DataFrame, path: str, index: bool = False, force: bool = False) -> None:
         if self.analysis or force:
-            data.to_csv(f'{self.output_path}/{path}', index=index)
+            data = resolve_schema(path).apply(data.reset_index() if index else data, strict=True)
+            self.remove_stale_groups(path)
+            path, storage_format = resolve_storage_format(path, self.storage_format)
+            # an earlier partitioned run leaves a directory of parts at the same path
+            self.remove_output(f'{self.output_path}/{path}')
+            storage_format.write(data, f'{self.output_path}/{path}', index=False)
+            self.outputs.append(("output", path))
+
+    def save_partitions(self, parts: list, path: str, index: bool = False) -> None:
+        """Writes a dataset as a directory of parts, read back in part order as a single dataset."""
+        schema = resolve_schema(path)
+        self.remove_stale_groups(path)
+        path, storage_format = resolve_storage_format(path, self.storage_format)
+        if storage_format.extension != 'parquet':
+            raise ValueError(f"Partitioned datasets are only readable as parquet, not {storage_format.extension}")
+
+        directory = f'{self.output_path}/{path}'
+        self.remove_output(directory)
+        os.makedirs(directory)
+        for part, data in enumerate(parts):
+            storage_format.write(schema.apply(data.reset_index() if index else data, strict=True), f'{directory}/part-{part:05d}.{storage_format.extension}', index=False)
+        self.outputs.append(("output", path))
+
+    def save_groups(self, data: pd.DataFrame, path: str, grouping: str) -> None:
+        """Writes the `<path>.groups` sidecar of a dataset sorted by `grouping`: every group with the start and length of its rows."""
+        self.save(group_layout(data[grouping].to_numpy()).rename(columns={'group': grouping}), f'{path}.groups', force=True)
+
+    def read(self, path: str, columns: list | None = None, filters: list | None = None) -> pd.DataFrame:
+        schema = resolve_schema(path)
+        path, storage_format = resolve_storage_format(path, self.storage_format)
+        return schema.apply(storage_format.read(f'{self.input_path}/{path}', columns=columns, filters=filters, dtypes=schema.dtypes))
+
+    def read_chunks(self, path: str, chunksize: int, columns: list | None = None, filters: list | None = None) -> Iterator[pd.DataFrame]:
+        schema = resolve_schema(path)
+        path, storage_format = resolve_storage_format(path, self.storage_format)
+        chunks = storage_format.read_chunks(f'{self.input_path}/{path}', chunksize, columns=columns, filters=filters, dtypes=schema.dtypes)
+        return (schema.apply(chunk) for chunk in chunks)
+
+    def locate_input(self, path: str) -> tuple[str, StorageFormat]:
+        """File and storage format of an input, for workers reading it on their own."""
+        path, storage_format = resolve_storage_format(path, self.storage_format)
+        return f'{self.input_path}/{path}', storage_format
+
+    def list_inputs(self, path: str) -> list[str]:
+        directory = f'{self.input_path}/{path}'
+        if not os.path.isdir(directory):
+            return []
+        return sorted(f'{path}/{file}' for file in os.listdir(directory) if not file.startswith('.'))
+
+    def save_state(self, data: pd.DataFrame, path: str, index: bool = False) -> None:
+        path, storage_format = resolve_storage_format(path, self.storage_format)
+        os.makedirs(os.path.dirname(f'{self.state_path}/{path}'), exist_ok=True)
+        storage_format.write(data, f'{self.state_path}/{path}', index=index)
+
+    def read_state(self, path: str) -> pd.DataFrame | None:
+        path, storage_format = resolve_storage_format(path, self.storage_format)
+        if not os.path.exists(f'{self.state_path}/{path}'):
+            return None
+        return storage_format.read(f'{self.state_path}/{path}')
+
+    def delete_state(self, path: str) -> None:
+        path, _ = resolve_storage_format(path, self.storage_format)
+        if os.path.exists(f'{self.state_path}/{path}'):
+            os.remove(f'{self.state_path}/{path}')
+
+    def get_state_manifest(self) -> dict:
+        if not os.path.exists(f'{self.state_path}/{self.STATE_MANIFEST}'):
+            return {}
+        with open(f'{self.state_path}/{self.STATE_MANIFEST}', "r") as f:
+            return json.load(f)
+
+    def save_state_manifest(self, manifest: dict) -> None:
+        """Replaces the manifest in one rename, the state files it names are committed together with it."""
+        os.makedirs(self.state_path, exist_ok=True)
+        with open(f'{self.state_path}/{self.STATE_MANIFEST}.tmp', 'w') as outfile:
+            outfile.write(json.dumps(manifest, indent=4))
+        os.replace(f'{self.state_path}/{self.STATE_MANIFEST}.tmp', f'{self.state_path}/{self.STATE_MANIFEST}')
+
+    def get_cache_key(self, inputs: list[str], config: dict) -> str | None:
+        """Step cache key of a run over the `inputs` files, None when no step cache is configured."""
+        if self.step_cache is None:
+            return None
+        config = {**config, "storage_format": self.storage_format, "analysis": self.analysis}
+        return self.step_cache.fingerprint({path: f'{self.input_path}/{path}' for path in inputs}, config, os.path.dirname(os.path.abspath(__file__)))
+
+    def restore_outputs(self, key: str) -> bool:
+        return self.step_cache.restore(key, {"output": self.output_path})
 
-    def read(self, path: str) -> pd.DataFrame:
-        return pd.read_csv(f'{self.input_path}/{path}')
+    def store_outputs(self, key: str) -> None:
+        self.step_cache.store(key, {"output": self.output_path}, self.outputs)
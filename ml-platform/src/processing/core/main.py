@@ -6,28 +6,58 @@ from logging import Logger
 from data_preprocessing import DataPreProcessing
 from fs_repository_interface import FileSystemRepository
 from logger import LoggerFactory
+from profiler import Profiler
+from step_cache import StepCache
 
 LOGLEVEL = os.getenv('LOGLEVEL')
+DATA_PATH = os.getenv('DATA_PATH')
 MODE = os.getenv('MODE')
+STORAGE_FORMAT = os.getenv('STORAGE_FORMAT')
+EVENTS_CHUNK_SIZE = os.getenv('EVENTS_CHUNK_SIZE')
+PROPERTIES_CHUNK_SIZE = os.getenv('PROPERTIES_CHUNK_SIZE')
+PROCESSING_WORKERS = os.getenv('PROCESSING_WORKERS')
+INCREMENTAL = os.getenv('INCREMENTAL')
+STATE_PATH = os.getenv('STATE_PATH')
+RANDOM_SEED = os.getenv('RANDOM_SEED')
+SPLIT_STRATIFY = os.getenv('SPLIT_STRATIFY')
+SPLIT_PARTITIONS = os.getenv('SPLIT_PARTITIONS')
+STEP_CACHE_PATH = os.getenv('STEP_CACHE_PATH')
+STEP_CACHE_MAX_MB = os.getenv('STEP_CACHE_MAX_MB')
 
 di[Logger] = LoggerFactory.create_logger(LOGLEVEL or "INFO")
+di[Profiler] = Profiler("processing")
 inputPath = '/opt/ml/processing/input'
 outputPath = '/opt/ml/processing/output'
-inputPath = '../../../data/input'
-outputPath = '../../../data'
+inputPath = f"{DATA_PATH or '../../../data'}/input"
+outputPath = DATA_PATH or '../../../data'
 
 di[FileSystemRepository] = FileSystemRepository(
     inputPath,
     outputPath,
-    MODE == 'DEVELOPMENT'
+    MODE == 'DEVELOPMENT',
+    STORAGE_FORMAT or "parquet",
+    STATE_PATH,
+    StepCache(STEP_CACHE_PATH, int(STEP_CACHE_MAX_MB or 10240)) if STEP_CACHE_PATH else None
 )
+di[Profiler].instrument(di[FileSystemRepository], prefix="repository")
+di["events_chunk_size"] = int(EVENTS_CHUNK_SIZE or 0)
+di["properties_chunk_size"] = int(PROPERTIES_CHUNK_SIZE or 1000000)
+di["processing_workers"] = int(PROCESSING_WORKERS or 0)
+di["incremental"] = INCREMENTAL == 'true'
+di["random_seed"] = int(RANDOM_SEED or 42)
+di["split_stratify"] = SPLIT_STRATIFY != 'false'
+di["split_partitions"] = int(SPLIT_PARTITIONS or 0)
 
 def main():
     try:
         usecase = DataPreProcessing()
         usecase.prepare()
-    except Exception as e:
-        print(e)
+    except Exception:
+        # a failed run must exit non zero, the pipeline and the benchmark runner tell failures from the exit code
+        di[Logger].exception("Processing failed")
+        raise
+    finally:
+        di[Profiler].save(f"{outputPath}/metrics")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,114 @@
+import glob
+import os
+import shutil
+import tempfile
+import time
+import fireducks.pandas as pd
+from concurrent.futures import Executor
+from dataset_schema import DatasetSchema
+from dataset_split import partition_groups, partition_pairs
+from profiler import Profiler, peak_rss_mb
+from storage_format import STORAGE_FORMATS, StorageFormat
+
+PAIR_KEYS = ['visitorid', 'itemid']
+SPILL_FORMAT = STORAGE_FORMATS['parquet']
+
+
+def event_aggregations(event_counters: dict) -> dict:
+    return {**{counter: 'sum' for counter in event_counters.values()}, 'timestamp': 'max'}
+
+
+def aggregate_events(df, intentions: dict, event_counters: dict):
+    """Counters and latest timestamp of every (visitor, item) pair of a frame of events."""
+    df = df.assign(event_code=df['event'].map(intentions))
+    for code, counter in event_counters.items():
+        df[counter] = (df['event_code'] == code).astype('int32')
+
+    return df.groupby(PAIR_KEYS)[list(event_counters.values()) + ['timestamp']].agg(event_aggregations(event_counters))
+
+
+def merge_events_aggregates(aggregates: list, event_counters: dict):
+    df = pd.concat(aggregates)
+    return df.groupby(level=PAIR_KEYS).agg(event_aggregations(event_counters))
+
+
+def write_partitions(df, partitions, count: int, path: str, name: str) -> None:
+    # every partition gets a file, even empty, so a reducer never has to tell a missing piece from an empty one
+    for partition in range(count):
+        os.makedirs(f'{path}/partition-{partition:05d}', exist_ok=True)
+        SPILL_FORMAT.write(df[partitions == partition], f'{path}/partition-{partition:05d}/{name}.{SPILL_FORMAT.extension}', index=True)
+
+
+def read_partition(path: str, partition: int, index: list) -> list:
+    return [
+        SPILL_FORMAT.read(file).set_index(index)
+        for file in sorted(glob.glob(f'{path}/partition-{partition:05d}/*.{SPILL_FORMAT.extension}'))
+    ]
+
+
+def map_events_split(file: str, storage_format: StorageFormat, schema: DatasetSchema, columns: list, split: int, splits: int, intentions: dict, event_counters: dict, partitions: int, seed: int, spill_path: str) -> tuple[None, dict]:
+    """Aggregates one split of the events file and spills the pair aggregates by (visitorid, itemid) hash partition."""
+    started = time.perf_counter()
+    df = schema.apply(storage_format.read_split(file, split, splits, columns=columns, dtypes=schema.dtypes))
+    aggregate = aggregate_events(df, intentions, event_counters)
+    pairs = aggregate.index
+    write_partitions(aggregate, partition_pairs(pairs.get_level_values('visitorid'), pairs.get_level_values('itemid'), partitions, seed), partitions, f'{spill_path}/pairs', f'split-{split:05d}')
+
+    return None, dict(seconds=time.perf_counter() - started, rows=len(df), peak_rss=peak_rss_mb())
+
+
+def reduce_pairs_partition(partition: int, event_counters: dict, partitions: int, seed: int, spill_path: str) -> tuple[None, dict]:
+    """Merges the pair aggregates of one partition, then spills their per item sums by itemid hash partition."""
+    started = time.perf_counter()
+    aggregate = merge_events_aggregates(read_partition(f'{spill_path}/pairs', partition, PAIR_KEYS), event_counters)
+    items = aggregate.groupby(level='itemid')[list(event_counters.values())].sum()
+    write_partitions(items, partition_groups(items.index, partitions, seed), partitions, f'{spill_path}/items', f'pairs-{partition:05d}')
+
+    return None, dict(seconds=time.perf_counter() - started, rows=len(aggregate), peak_rss=peak_rss_mb())
+
+
+def reduce_items_partition(partition: int, spill_path: str) -> tuple:
+    """Item stats of one itemid partition, the sum of its per item sums."""
+    started = time.perf_counter()
+    df = pd.concat(read_partition(f'{spill_path}/items', partition, ['itemid'])).groupby(level='itemid').sum()
+
+    return df, dict(seconds=time.perf_counter() - started, rows=len(df), peak_rss=peak_rss_mb())
+
+
+class PartitionedEvents:
+    """Items stats of the events computed on a process pool, in three hash partitioned steps.
+
+    Every worker parses and aggregates its own split of the events file, the pair aggregates are spilled by
+    (visitorid, itemid) hash and merged one partition per worker, and their per item sums are spilled by itemid
+    hash and summed the same way. Steps only exchange partition files, so they can later run on separate
+    instances sharing `spill_path`. Partitions are merged in a fixed order, the result does not depend on
+    which worker finished first.
+    """
+
+    def __init__(self, executor: Executor, profiler: Profiler, partitions: int, seed: int = 0, spill_path: str | None = None) -> None:
+        self.executor = executor
+        self.profiler = profiler
+        self.partitions = partitions
+        self.seed = seed
+        self.spill_path = spill_path or tempfile.mkdtemp(prefix="partitions-")
+        self.owned = spill_path is None
+
+    def run(self, step: str, function, tasks: list) -> list:
+        futures = [self.profiler.track(f'partition.{step}', self.executor.submit(function, *task)) for task in tasks]
+        return [future.result() for future in futures]
+
+    def items_stats(self, file: str, storage_format: StorageFormat, schema: DatasetSchema, columns: list, intentions: dict, event_counters: dict):
+        try:
+            self.run('map', map_events_split, [
+                (file, storage_format, schema, columns, split, self.partitions, intentions, event_counters, self.partitions, self.seed, self.spill_path)
+                for split in range(self.partitions)
+            ])
+            self.run('pairs', reduce_pairs_partition, [
+                (partition, event_counters, self.partitions, self.seed, self.spill_path)
+                for partition in range(self.partitions)
+            ])
+            stats = self.run('items', reduce_items_partition, [(partition, self.spill_path) for partition in range(self.partitions)])
+            return pd.concat(stats).sort_index()
+        finally:
+            if self.owned:
+                shutil.rmtree(self.spill_path, ignore_errors=True)
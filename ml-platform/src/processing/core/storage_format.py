@@ -0,0 +1,168 @@
+import io
+import os
+import numpy as np
+# stage copies differ on this line only, frames are built with the pandas of the stage's repository
+# (fireducks in processing and understanding, pandas in the others)
+import fireducks.pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from typing import Iterator
+
+
+def read_dataset_chunks(path: str, file_format: str, chunksize: int, columns: list | None = None, filters: list | None = None) -> Iterator[pd.DataFrame]:
+    dataset = ds.dataset(path, format=file_format)
+    # filters are pushed down to the scan, non matching rows are never materialized
+    for batch in dataset.to_batches(columns=columns, filter=pq.filters_to_expression(filters) if filters else None, batch_size=chunksize):
+        yield pd.DataFrame(batch.to_pandas())
+
+
+def read_dataset_split(path: str, file_format: str, split: int, splits: int, columns: list | None = None) -> pd.DataFrame:
+    dataset = ds.dataset(path, format=file_format)
+    # parquet files are split on row groups, every other file is a single piece
+    pieces = [piece for fragment in dataset.get_fragments() for piece in (fragment.split_by_row_group() if file_format == "parquet" else [fragment])]
+    tables = [piece.to_table(columns=columns) for piece in pieces[split::splits]]
+    return pd.DataFrame((pa.concat_tables(tables) if tables else dataset.schema.empty_table().select(columns or dataset.schema.names)).to_pandas())
+
+
+def apply_filters(df: pd.DataFrame, filters: list | None) -> pd.DataFrame:
+    if not filters:
+        return df
+
+    operators = {
+        '==': lambda column, value: column == value,
+        '=': lambda column, value: column == value,
+        '!=': lambda column, value: column != value,
+        '<': lambda column, value: column < value,
+        '<=': lambda column, value: column <= value,
+        '>': lambda column, value: column > value,
+        '>=': lambda column, value: column >= value,
+        'in': lambda column, value: column.isin(value),
+        'not in': lambda column, value: ~column.isin(value),
+    }
+
+    mask = None
+    for column, operator, value in filters:
+        condition = operators[operator](df[column], value)
+        mask = condition if mask is None else mask & condition
+
+    return df[mask]
+
+
+def group_layout(groups) -> pd.DataFrame:
+    """Start and length of every run of equal values, the boundaries of a dataset sorted by group."""
+    groups = np.asarray(groups)
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]]) if len(groups) else np.array([], dtype=np.int64)
+    return pd.DataFrame({'group': groups[starts], 'start': starts, 'length': np.diff(np.r_[starts, len(groups)])})
+
+
+class StorageFormat:
+    extension = ""
+
+    def read(self, path: str, columns: list | None = None, filters: list | None = None, dtypes: dict | None = None) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def read_chunks(self, path: str, chunksize: int, columns: list | None = None, filters: list | None = None, dtypes: dict | None = None) -> Iterator[pd.DataFrame]:
+        raise NotImplementedError
+
+    def read_split(self, path: str, split: int, splits: int, columns: list | None = None, dtypes: dict | None = None) -> pd.DataFrame:
+        """Rows of the `split`-th of `splits` disjoint pieces of the file, so workers can each parse their own piece."""
+        raise NotImplementedError
+
+    def write(self, data: pd.DataFrame, path: str, index: bool = False) -> None:
+        raise NotImplementedError
+
+
+class CsvFormat(StorageFormat):
+    extension = "csv"
+
+    def read(self, path: str, columns: list | None = None, filters: list | None = None, dtypes: dict | None = None) -> pd.DataFrame:
+        filter_columns = [column for column, _, _ in filters or [] if columns and column not in columns]
+        # declared dtypes are parsed directly, the parser only infers the others
+        df = pd.read_csv(path, usecols=columns + filter_columns if columns else None, dtype=dtypes)
+        df = apply_filters(df, filters)
+        return df.drop(columns=filter_columns) if filter_columns else df
+
+    def read_chunks(self, path: str, chunksize: int, columns: list | None = None, filters: list | None = None, dtypes: dict | None = None) -> Iterator[pd.DataFrame]:
+        # every chunk is filtered as it is parsed, only its matching rows outlive it
+        filter_columns = [column for column, _, _ in filters or [] if columns and column not in columns]
+        with pd.read_csv(path, usecols=columns + filter_columns if columns else None, dtype=dtypes, chunksize=chunksize) as reader:
+            for chunk in reader:
+                chunk = apply_filters(chunk, filters)
+                yield chunk.drop(columns=filter_columns) if filter_columns else chunk
+
+    def read_split(self, path: str, split: int, splits: int, columns: list | None = None, dtypes: dict | None = None) -> pd.DataFrame:
+        # pieces are byte ranges of the body, a line belongs to the range its first byte falls in
+        with open(path, "rb") as f:
+            header = f.readline()
+            body = f.tell()
+            size = os.fstat(f.fileno()).st_size - body
+            start, end = body + size * split // splits, body + size * (split + 1) // splits
+            if start > body:
+                f.seek(start - 1)
+                f.readline()
+            data = f.read(max(end - f.tell(), 0))
+            if data and not data.endswith(b"\n"):
+                data += f.readline()
+
+        return pd.read_csv(io.BytesIO(header + data), usecols=columns, dtype=dtypes)
+
+    def write(self, data: pd.DataFrame, path: str, index: bool = False) -> None:
+        data.to_csv(path, index=index)
+
+
+class ParquetFormat(StorageFormat):
+    extension = "parquet"
+
+    def read(self, path: str, columns: list | None = None, filters: list | None = None, dtypes: dict | None = None) -> pd.DataFrame:
+        return pd.read_parquet(path, columns=columns, filters=filters or None)
+
+    def read_chunks(self, path: str, chunksize: int, columns: list | None = None, filters: list | None = None, dtypes: dict | None = None) -> Iterator[pd.DataFrame]:
+        return read_dataset_chunks(path, "parquet", chunksize, columns, filters)
+
+    def read_split(self, path: str, split: int, splits: int, columns: list | None = None, dtypes: dict | None = None) -> pd.DataFrame:
+        return read_dataset_split(path, "parquet", split, splits, columns)
+
+    def write(self, data: pd.DataFrame, path: str, index: bool = False) -> None:
+        # the index is materialized as regular columns so every format reads back the same frame layout
+        data = data.reset_index() if index else data
+        data.to_parquet(path, index=False)
+
+
+class FeatherFormat(StorageFormat):
+    extension = "feather"
+
+    def read(self, path: str, columns: list | None = None, filters: list | None = None, dtypes: dict | None = None) -> pd.DataFrame:
+        filter_columns = [column for column, _, _ in filters or [] if columns and column not in columns]
+        df = pd.read_feather(path, columns=columns + filter_columns if columns else None)
+        df = apply_filters(df, filters)
+        return df.drop(columns=filter_columns) if filter_columns else df
+
+    def read_chunks(self, path: str, chunksize: int, columns: list | None = None, filters: list | None = None, dtypes: dict | None = None) -> Iterator[pd.DataFrame]:
+        return read_dataset_chunks(path, "feather", chunksize, columns, filters)
+
+    def read_split(self, path: str, split: int, splits: int, columns: list | None = None, dtypes: dict | None = None) -> pd.DataFrame:
+        return read_dataset_split(path, "feather", split, splits, columns)
+
+    def write(self, data: pd.DataFrame, path: str, index: bool = False) -> None:
+        data = data.reset_index() if index else data.reset_index(drop=True)
+        data.to_feather(path)
+
+
+STORAGE_FORMATS = {
+    storage_format.extension: storage_format
+    for storage_format in (CsvFormat(), ParquetFormat(), FeatherFormat())
+}
+
+
+def resolve_storage_format(path: str, default: str) -> tuple[str, StorageFormat]:
+    """Resolves the storage format of a dataset path.
+
+    Paths carrying a known extension (ex. raw `events.csv`) keep their own format,
+    logical dataset names (ex. `training`) get the default format extension appended.
+    """
+    extension = os.path.splitext(path)[1].lstrip('.')
+    if extension in STORAGE_FORMATS:
+        return path, STORAGE_FORMATS[extension]
+
+    return f'{path}.{default}', STORAGE_FORMATS[default]
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# stage modules import each other by name, as they do when run from core/main.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "core"))
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from dataset_schema import ITEMS, SchemaError, resolve_schema
+from storage_format import STORAGE_FORMATS
+
+
+def make_items():
+    return pd.DataFrame({
+        "itemid": np.arange(6, dtype=np.int64),
+        "category": np.array([1338, 1338, 9, 9, 9, 250], dtype=np.int64),
+        **{column: np.linspace(0, 1, 6) for column in ["views", "favorites", "purchased"]},
+        **{column: np.linspace(0, 1, 6) for column in ["relevance", "price", "views_norm", "price_rel_cat", "price_x_views", "price_rel_cat_x_views"]},
+    })
+
+
+@pytest.mark.parametrize("extension", ["parquet", "feather", "csv"])
+def test_items_dtypes_are_persisted(tmp_path, extension):
+    file = f"{tmp_path}/training.{extension}"
+    STORAGE_FORMATS[extension].write(ITEMS.apply(make_items(), strict=True), file)
+
+    if extension == "parquet":
+        assert str(pq.read_schema(file).field("category").type) == "int32"
+    schema = resolve_schema("training")
+    df = schema.apply(STORAGE_FORMATS[extension].read(file, dtypes=schema.dtypes))
+    assert {column: str(dtype) for column, dtype in df.dtypes.items()} == {column: str(dtype) for column, dtype in ITEMS.dtypes.items()}
+
+
+def test_undeclared_columns_are_rejected_on_save():
+    with pytest.raises(SchemaError):
+        ITEMS.apply(make_items().assign(price_bucket=1), strict=True)
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+from dataset_split import split_mask
+from fs_repository_interface import FileSystemRepository
+
+
+def make_items(count=5000, seed=3):
+    random = np.random.default_rng(seed)
+    ids = random.choice(10 ** 7, size=count, replace=False)
+    # many small categories, a fifth of them singletons
+    groups = np.r_[np.arange(200), random.integers(200, 400, size=count - 200)]
+    return ids, groups
+
+
+@pytest.mark.parametrize("stratified", [False, True])
+def test_split_is_stable_across_order_and_subsets(stratified):
+    ids, groups = make_items()
+    mask = split_mask(ids, 0.7, seed=42, groups=groups if stratified else None)
+
+    order = np.random.default_rng(0).permutation(len(ids))
+    assert (split_mask(ids[order], 0.7, seed=42, groups=groups[order] if stratified else None) == mask[order]).all()
+    # the same call splits the same way, a different seed does not
+    assert (split_mask(ids, 0.7, seed=42, groups=groups if stratified else None) == mask).all()
+    assert (split_mask(ids, 0.7, seed=7, groups=groups if stratified else None) != mask).any()
+    if not stratified:
+        # unstratified rows are decided on their own id, any chunk of a stream splits as the whole
+        assert (split_mask(ids[:1000], 0.7, seed=42) == mask[:1000]).all()
+
+
+def test_every_item_lands_in_exactly_one_split():
+    ids, groups = make_items()
+    mask = split_mask(ids, 0.7, seed=42, groups=groups)
+    training, testing = set(ids[mask]), set(ids[~mask])
+
+    assert not training & testing
+    assert training | testing == set(ids)
+
+    # an id seen twice, ex. in two chunks of a stream, lands in the same split both times
+    repeated = np.r_[ids, ids[:500]]
+    repeated_mask = split_mask(repeated, 0.7, seed=42)
+    assert (repeated_mask[len(ids):] == repeated_mask[:500]).all()
+
+
+def test_stratified_split_keeps_the_share_of_every_group():
+    ids, groups = make_items()
+    mask = split_mask(ids, 0.7, seed=42, groups=groups)
+
+    for group in np.unique(groups):
+        in_group = groups == group
+        assert mask[in_group].sum() == np.floor(in_group.sum() * 0.7 + 0.5)
+    # a singleton group rounds to training, its only item never leaks into testing
+    singletons = np.flatnonzero(np.bincount(groups) == 1)
+    assert mask[np.isin(groups, singletons)].all()
+
+
+
+def test_stratified_split_rejects_streamed_input():
+    ids, groups = make_items()
+    with pytest.raises(ValueError):
+        split_mask(ids, 0.7, seed=42, groups=(chunk for chunk in np.array_split(groups, 4)))
+    with pytest.raises(ValueError):
+        split_mask(ids, 0.7, seed=42, groups=groups[:1000])
+
+def test_unpartitioned_save_replaces_a_partitioned_one(tmp_path):
+    repository = FileSystemRepository(str(tmp_path), str(tmp_path))
+    ids, groups = make_items(count=400)
+    df = pd.DataFrame({"itemid": ids, "category": groups, "price": np.linspace(0, 1, len(ids))}).sort_values("category", kind="stable")
+
+    repository.save_partitions([df.iloc[:150], df.iloc[150:]], "training")
+    repository.save_groups(df, "training", "category")
+    assert (tmp_path / "training.parquet").is_dir()
+
+    # a later run without SPLIT_PARTITIONS writes a single file, and no layout until save_groups runs
+    repository.save(df.iloc[:100], "training", force=True)
+    assert (tmp_path / "training.parquet").is_file()
+    assert not (tmp_path / "training.groups.parquet").exists()
+    pd.testing.assert_frame_equal(repository.read("training"), df.iloc[:100].reset_index(drop=True).astype({"itemid": "int32", "category": "int32", "price": "float32"}))
+
+    repository.save_groups(df.iloc[:100], "training", "category")
+    assert repository.read("training.groups")["length"].sum() == 100
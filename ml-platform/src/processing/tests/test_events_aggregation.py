@@ -0,0 +1,139 @@
+import logging
+import numpy as np
+import pandas as pd
+import pytest
+from kink import di
+from logging import Logger
+from data_preprocessing import DataPreProcessing
+from fs_repository_interface import FileSystemRepository
+from profiler import Profiler
+
+
+def make_events(seed, rows, timestamps):
+    random = np.random.default_rng(seed)
+    events = random.choice(["view", "addtocart", "transaction"], size=rows, p=[0.8, 0.15, 0.05])
+    return pd.DataFrame({
+        "timestamp": random.integers(*timestamps, size=rows),
+        "visitorid": random.integers(0, 40, size=rows),
+        "event": events,
+        "itemid": random.integers(0, 25, size=rows),
+        "transactionid": np.where(events == "transaction", random.integers(0, 1000, size=rows), np.nan),
+    })
+
+
+def make_processing(data_path, events_chunk_size=0, incremental=True):
+    # bound as in core/main.py, a fresh repository per run
+    di[Logger] = logging.getLogger("processing")
+    di[Profiler] = Profiler("processing")
+    di[FileSystemRepository] = FileSystemRepository(f"{data_path}/input", str(data_path))
+    return DataPreProcessing(events_chunk_size=events_chunk_size, incremental=incremental)
+
+
+def write_events(data_path, rows=3000):
+    (data_path / "input").mkdir(parents=True, exist_ok=True)
+    make_events(4, rows, (1000, 9000)).to_csv(data_path / "input" / "events.csv", index=False)
+
+
+def in_memory_events(data_path):
+    processing = make_processing(data_path, incremental=False)
+    return processing.prepare_events(processing.data_repository.read("events.csv"))
+
+
+def assert_same_counters(left, right):
+    counters = ["views", "favorites", "purchased"]
+    pd.testing.assert_frame_equal(
+        left[counters].astype("float64").sort_index(),
+        right[counters].astype("float64").sort_index(),
+        check_names=False,
+        check_index_type=False,
+    )
+
+
+@pytest.mark.parametrize("events_chunk_size", [50, 997, 10000])
+def test_streaming_aggregation_matches_the_in_memory_one(tmp_path, events_chunk_size):
+    write_events(tmp_path)
+    df_events = in_memory_events(tmp_path)
+
+    processing = make_processing(tmp_path, events_chunk_size, incremental=False)
+    df_stream = processing.prepare_events_stream(processing.data_repository.read_chunks("events.csv", events_chunk_size, columns=processing.event_columns))
+
+    assert_same_counters(df_stream, df_events)
+    # pairs are ordered by visitor, then by their latest event, like the in-memory frame
+    assert list(df_stream.index.get_level_values("visitorid")) == sorted(df_stream.index.get_level_values("visitorid"))
+    assert_same_counters(processing.prepare_items_stats(df_stream), processing.prepare_items_stats(df_events))
+
+
+@pytest.mark.parametrize("events_chunk_size", [0, 50])
+def test_incremental_runs_match_a_full_run_with_a_late_partition(tmp_path, events_chunk_size):
+    (tmp_path / "input" / "events").mkdir(parents=True)
+    partitions = [
+        make_events(1, 400, (1000, 2000)),
+        make_events(2, 300, (2000, 3000)),
+        # late partition: every event is older than the ones already processed
+        make_events(3, 200, (500, 1500)),
+    ]
+
+    for number, events in enumerate(partitions):
+        events.to_csv(tmp_path / "input" / "events" / f"part-{number}.csv", index=False)
+        df_incremental = make_processing(tmp_path, events_chunk_size).prepare_incremental_items_stats()
+
+    full = make_processing(tmp_path)
+    events = pd.concat([full.data_repository.read(f"events/part-{number}.csv") for number in range(len(partitions))], ignore_index=True)
+    df_full = full.prepare_items_stats(full.prepare_events(events))
+
+    counters = list(full.event_counters.values())
+    pd.testing.assert_frame_equal(
+        df_incremental[counters].astype("float64").sort_index(),
+        df_full[counters].astype("float64").sort_index(),
+        check_names=False,
+        check_index_type=False,
+    )
+    assert full.data_repository.get_state_manifest()["partitions"] == [f"events/part-{number}.csv" for number in range(len(partitions))]
+
+
+@pytest.mark.parametrize("events_state_max_parts", [30, 1])
+def test_a_run_interrupted_before_its_manifest_is_not_counted_twice(tmp_path, monkeypatch, events_state_max_parts):
+    (tmp_path / "input" / "events").mkdir(parents=True)
+    partitions = [make_events(1, 400, (1000, 2000)), make_events(2, 300, (2000, 3000))]
+    for number, events in enumerate(partitions):
+        events.to_csv(tmp_path / "input" / "events" / f"part-{number}.csv", index=False)
+        processing = make_processing(tmp_path)
+        processing.events_state_max_parts = events_state_max_parts
+        if number:
+            # the new state files are written, the process dies before committing them
+            def crash(manifest):
+                raise RuntimeError("interrupted")
+            monkeypatch.setattr(processing.data_repository, "save_state_manifest", crash)
+            with pytest.raises(RuntimeError):
+                processing.prepare_incremental_items_stats()
+            monkeypatch.undo()
+            processing = make_processing(tmp_path)
+            processing.events_state_max_parts = events_state_max_parts
+        df_incremental = processing.prepare_incremental_items_stats()
+
+    full = make_processing(tmp_path)
+    events = pd.concat([full.data_repository.read(f"events/part-{number}.csv") for number in range(len(partitions))], ignore_index=True)
+    df_full = full.prepare_items_stats(full.prepare_events(events))
+
+    counters = list(full.event_counters.values())
+    pd.testing.assert_frame_equal(
+        df_incremental[counters].astype("float64").sort_index(),
+        df_full[counters].astype("float64").sort_index(),
+        check_names=False,
+        check_index_type=False,
+    )
+    # a third run with nothing new reads back the committed state alone
+    pd.testing.assert_frame_equal(make_processing(tmp_path).prepare_incremental_items_stats(), df_incremental, check_dtype=False)
+
+@pytest.mark.parametrize("processing_workers", [1, 3, 8])
+def test_partitioned_items_stats_match_the_single_process_ones(tmp_path, processing_workers):
+    write_events(tmp_path)
+    processing = make_processing(tmp_path, incremental=False)
+    df_items_stats = processing.prepare_items_stats(in_memory_events(tmp_path))
+
+    processing = make_processing(tmp_path, incremental=False)
+    processing.processing_workers = processing_workers
+    df_partitioned = processing.prepare_partitioned_items_stats()
+
+    assert_same_counters(df_partitioned, df_items_stats)
+    assert df_partitioned.index.is_monotonic_increasing
@@ -0,0 +1,40 @@
+import os
+import pytest
+
+SOURCE_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# modules every listed stage carries its own copy of, the first stage holding the reference copy
+SHARED_MODULES = {
+    "dataset_schema.py": ["processing", "training", "testing", "understanding", "inference"],
+    "storage_format.py": ["processing", "training", "testing", "understanding", "inference"],
+    "profiler.py": ["processing", "training", "testing", "understanding", "inference"],
+    "step_cache.py": ["processing", "training"],
+}
+REPOSITORIES = {"understanding": "sagemaker_repository_interface.py"}
+PANDAS_IMPORTS = ["import fireducks.pandas as pd", "import pandas as pd"]
+
+
+def read_module(stage, module):
+    with open(f"{SOURCE_PATH}/{stage}/core/{module}", "r") as f:
+        return f.read()
+
+
+def pandas_import(source):
+    return next(line for line in source.splitlines() if line in PANDAS_IMPORTS)
+
+
+def normalized(stage, module):
+    # storage_format builds its frames with the pandas of the stage's repository, the one line its copies differ on
+    source = read_module(stage, module)
+    return source.replace(pandas_import(source), PANDAS_IMPORTS[-1], 1) if module == "storage_format.py" else source
+
+
+@pytest.mark.parametrize("module,stage", [(module, stage) for module, stages in SHARED_MODULES.items() for stage in stages[1:]])
+def test_stage_copies_match_the_reference(module, stage):
+    assert normalized(stage, module) == normalized(SHARED_MODULES[module][0], module), f"{stage}/core/{module} drifted from {SHARED_MODULES[module][0]}/core/{module}"
+
+
+@pytest.mark.parametrize("stage", SHARED_MODULES["storage_format.py"])
+def test_storage_format_uses_the_pandas_of_its_repository(stage):
+    repository = read_module(stage, REPOSITORIES.get(stage, "fs_repository_interface.py"))
+    assert pandas_import(read_module(stage, "storage_format.py")) == pandas_import(repository)
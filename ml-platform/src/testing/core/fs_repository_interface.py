@@ -1,31 +1,63 @@
 import pandas as pd
 from kink import inject
 import json
+import os
 import pickle
+from catboost import CatBoostRanker
+from dataset_schema import resolve_schema
+from storage_format import resolve_storage_format
 
 
 @inject()
 class FileSystemRepository():
-    def __init__(self, input_path: str, output_path: str, analysis: bool = False) -> None:
+    def __init__(self, input_path: str, output_path: str, analysis: bool = False, storage_format: str = "parquet") -> None:
         self.input_path = input_path
         self.output_path = output_path
         self.analysis = analysis
+        self.storage_format = storage_format
+        self.models = {}
 
     def save(self, data: pd.DataFrame, path: str, index: bool = False, force: bool = False) -> None:
         if self.analysis or force:
-            data.to_csv(f'{self.output_path}/{path}', index=index)
+            data = resolve_schema(path).apply(data.reset_index() if index else data, strict=True)
+            path, storage_format = resolve_storage_format(path, self.storage_format)
+            storage_format.write(data, f'{self.output_path}/{path}', index=False)
 
-    def read(self, path: str) -> pd.DataFrame:
-        return pd.read_csv(f'{self.input_path}/{path}')
+    def read(self, path: str, columns: list | None = None, filters: list | None = None) -> pd.DataFrame:
+        schema = resolve_schema(path)
+        path, storage_format = resolve_storage_format(path, self.storage_format)
+        return schema.apply(storage_format.read(f'{self.input_path}/{path}', columns=columns, filters=filters, dtypes=schema.dtypes))
+
+    def read_groups(self, path: str) -> pd.DataFrame | None:
+        """Group boundaries written alongside a dataset sorted by group, None when the dataset has no group layout."""
+        path, storage_format = resolve_storage_format(f'{path}.groups', self.storage_format)
+        if not os.path.exists(f'{self.input_path}/{path}'):
+            return None
+        return storage_format.read(f'{self.input_path}/{path}')
 
     def load_model(self, path: str, filename: str):
-        with open(f"{self.input_path}/{path}/{filename}.pkl", "rb") as f:
-            return pickle.load(f)
+        model_file = f"{self.input_path}/{path}/{filename}"
+        if model_file not in self.models:
+            if os.path.exists(f"{model_file}.cbm"):
+                self.models[model_file] = CatBoostRanker().load_model(f"{model_file}.cbm", format="cbm")
+            else:
+                # models pickled before the native format
+                with open(f"{model_file}.pkl", "rb") as f:
+                    self.models[model_file] = pickle.load(f)
+
+        return self.models[model_file]
         
     def get_hyperparameters(self, path: str):
         with open(f'{self.input_path}/{path}', "r") as f:
             return json.load(f)
 
+    def read_metrics(self, filename: str) -> dict | None:
+        """Metrics written by an earlier stage, None when they are missing."""
+        if not os.path.exists(f"{self.input_path}/{filename}"):
+            return None
+        with open(f"{self.input_path}/{filename}", "r") as f:
+            return json.load(f)
+
     def save_metrics(self, metrics: dict, filename: str):
         metrics_json = json.dumps(metrics, indent=4)
         with open(f"{self.output_path}/{filename}", 'w') as outfile:
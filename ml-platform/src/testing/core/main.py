@@ -6,23 +6,35 @@ from logging import Logger
 from model_validator import ModelValidation
 from fs_repository_interface import FileSystemRepository
 from logger import LoggerFactory
+from profiler import Profiler
 
 LOGLEVEL = os.getenv('LOGLEVEL')
+DATA_PATH = os.getenv('DATA_PATH')
 MODE = os.getenv('MODE')
+STORAGE_FORMAT = os.getenv('STORAGE_FORMAT')
+MAX_COUNT = os.getenv('MAX_COUNT')
 
-inputPath = '../../../data' #'/opt/ml/processing/input/data'
-outputPath = '../../../data' #'/opt/ml/processing/output/data'
+dataPath = DATA_PATH or '../../../data'
+inputPath = dataPath #'/opt/ml/processing/input/data'
+outputPath = dataPath #'/opt/ml/processing/output/data'
 
 di[Logger] = LoggerFactory.create_logger(LOGLEVEL or "INFO")
+di[Profiler] = Profiler("testing")
 di[FileSystemRepository] = FileSystemRepository(
     inputPath,
     outputPath,
-    MODE == "DEVELOPMENT"
+    MODE == "DEVELOPMENT",
+    STORAGE_FORMAT or "parquet"
 )
+di[Profiler].instrument(di[FileSystemRepository], prefix="repository")
+di["max_count"] = int(MAX_COUNT or ModelValidation.MAX_COUNT)
 
 def main():
     validator = ModelValidation()
-    validator.validate()
+    try:
+        validator.validate()
+    finally:
+        di[Profiler].save(f"{outputPath}/metrics")
 
 if __name__ == "__main__":
     main()
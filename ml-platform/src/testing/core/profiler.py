@@ -0,0 +1,125 @@
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import Future
+from contextlib import contextmanager
+from functools import wraps
+
+_DONE = object()
+
+
+def peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    """Peak resident set size so far, ru_maxrss is in KB on Linux and in bytes on macOS."""
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+def count_rows(value) -> int | None:
+    return len(value) if hasattr(value, "columns") else None
+
+
+class Span:
+    def __init__(self, rows: int | None = None) -> None:
+        self.rows = rows
+
+
+class Profiler:
+    """Wall time, rows and peak memory of the named spans of a stage, reported as one JSON profile.
+
+    Spans sharing a name are aggregated, a nested span counts in full in its parent as well.
+    """
+
+    def __init__(self, stage: str) -> None:
+        self.stage = stage
+        self.started = time.perf_counter()
+        self.spans = {}
+        self.lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, rows: int | None = None, peak_rss: float | None = None) -> None:
+        with self.lock:
+            span = self.spans.setdefault(name, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0, "rows": 0, "peak_rss_mb": 0.0})
+            span["calls"] += 1
+            span["seconds"] += seconds
+            span["max_seconds"] = max(span["max_seconds"], seconds)
+            span["rows"] += rows or 0
+            span["peak_rss_mb"] = max(span["peak_rss_mb"], peak_rss_mb() if peak_rss is None else peak_rss)
+
+    @contextmanager
+    def span(self, name: str, rows: int | None = None):
+        span = Span(rows)
+        started = time.perf_counter()
+        try:
+            yield span
+        finally:
+            self.record(name, time.perf_counter() - started, span.rows)
+
+    def iterate(self, name: str, chunks: Iterator) -> Iterator:
+        # a lazy reader does its work on every next(), each chunk is timed as it is pulled
+        while True:
+            started = time.perf_counter()
+            chunk = next(chunks, _DONE)
+            if chunk is _DONE:
+                return
+            self.record(name, time.perf_counter() - started, count_rows(chunk))
+            yield chunk
+
+    def wrap(self, name: str, method):
+        @wraps(method)
+        def profiled(*args, **kwargs):
+            started = time.perf_counter()
+            result = method(*args, **kwargs)
+            if isinstance(result, Iterator):
+                return self.iterate(name, result)
+
+            # rows of the returned frame, or of the first frame passed in (ex. a save)
+            rows = next((rows for rows in map(count_rows, (result, *args, *kwargs.values())) if rows is not None), None)
+            self.record(name, time.perf_counter() - started, rows)
+            return result
+
+        return profiled
+
+    def instrument(self, target, methods: list | None = None, prefix: str | None = None):
+        """Wraps methods of an instance, every public one by default, in spans named `<prefix>.<method>`."""
+        prefix = prefix or type(target).__name__
+        methods = methods or [method for method in dir(target) if not method.startswith("_") and callable(getattr(target, method))]
+        for method in methods:
+            setattr(target, method, self.wrap(f"{prefix}.{method}", getattr(target, method)))
+        return target
+
+    def track(self, name: str, future: Future) -> Future:
+        """Future of the result of a worker call returning `(result, span)`, the worker's span is recorded when it completes."""
+        tracked = Future()
+
+        def completed(future: Future) -> None:
+            if future.exception() is not None:
+                tracked.set_exception(future.exception())
+                return
+            result, span = future.result()
+            self.record(name, **span)
+            tracked.set_result(result)
+
+        future.add_done_callback(completed)
+        return tracked
+
+    def report(self) -> dict:
+        with self.lock:
+            spans = sorted(self.spans.items(), key=lambda item: -item[1]["seconds"])
+            return {
+                "stage": self.stage,
+                "wall_seconds": time.perf_counter() - self.started,
+                "peak_rss_mb": peak_rss_mb(),
+                "peak_children_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+                "spans": {
+                    name: {**span, "rows_per_second": span["rows"] / span["seconds"] if span["rows"] and span["seconds"] else None}
+                    for name, span in spans
+                },
+            }
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        with open(f"{path}/profile-{self.stage}.json", "w") as outfile:
+            outfile.write(json.dumps(self.report(), indent=4))
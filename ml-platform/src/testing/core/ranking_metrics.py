@@ -0,0 +1,118 @@
+import numpy as np
+import fireducks.pandas as pd
+
+DEFAULT_CUTOFFS = (5, 10, 100)
+
+
+def rank_within_groups(group_codes: np.ndarray, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Orders rows by (group, -value) and returns that order with the 0-based rank of each ordered row in its group."""
+    order = np.lexsort((-values, group_codes))
+    sorted_codes = group_codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    sizes = np.diff(np.r_[starts, len(order)])
+    positions = np.arange(len(order)) - np.repeat(starts, sizes)
+    return order, positions
+
+
+def encode_groups(group_ids, contiguous=False) -> tuple[np.ndarray, np.ndarray]:
+    """Distinct groups and the code of every row, rows of a contiguous layout are coded from their runs without sorting."""
+    group_ids = np.asarray(group_ids).ravel()
+    if not contiguous:
+        return np.unique(group_ids, return_inverse=True)
+
+    starts = np.flatnonzero(np.r_[True, group_ids[1:] != group_ids[:-1]]) if len(group_ids) else np.array([], dtype=int)
+    return group_ids[starts], np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(group_ids)]))
+
+
+def groupwise_ranking_metrics(y_true, y_score, group_ids, cutoffs=DEFAULT_CUTOFFS, relevance_threshold=None, contiguous=False) -> pd.DataFrame:
+    """NDCG@k, Precision@k, Recall@k, MAP@k and MRR of every group, for every cutoff, in one pass over sorted segments.
+
+    Gains are linear in y_true and tied scores share the mean gain of their tie (as sklearn's ndcg_score),
+    an item is relevant when y_true > 0 (or >= relevance_threshold when given) and the ranked list metrics
+    keep tied scores in their input order. With `contiguous`, the rows of every group are expected next to
+    each other (ex. the processing group layout).
+    """
+    y_true = np.asarray(y_true, dtype=float).ravel()
+    y_score = np.asarray(y_score, dtype=float).ravel()
+    groups, group_codes = encode_groups(group_ids, contiguous)
+    group_count = len(groups)
+    if not group_count:
+        metric_names = [f"{metric}@{k}" for k in cutoffs for metric in ("NDCG", "Precision", "Recall", "MAP")] + ["MRR"]
+        return pd.DataFrame({"group_id": groups, "size": np.array([], dtype=np.int64), **{name: np.array([], dtype=float) for name in metric_names}})
+
+    order, positions = rank_within_groups(group_codes, y_score)
+    codes = group_codes[order]
+    gains = y_true[order]
+    relevant = gains > 0 if relevance_threshold is None else gains >= relevance_threshold
+
+    scores = y_score[order]
+    ties = np.cumsum(np.r_[True, (codes[1:] != codes[:-1]) | (scores[1:] != scores[:-1])]) - 1
+    tie_gains = (np.bincount(ties, weights=gains) / np.bincount(ties))[ties]
+
+    ideal_order, ideal_positions = rank_within_groups(group_codes, y_true)
+    ideal_codes = group_codes[ideal_order]
+    ideal_gains = y_true[ideal_order]
+
+    discounts = 1 / np.log2(positions + 2)
+    ideal_discounts = 1 / np.log2(ideal_positions + 2)
+
+    sizes = np.bincount(codes, minlength=group_count)
+    total_relevant = np.bincount(codes, weights=relevant, minlength=group_count)
+
+    # running count of relevant items inside each group, for precision at every relevant rank
+    hits = np.cumsum(relevant)
+    group_starts = np.r_[0, np.cumsum(sizes)[:-1]]
+    hits_before_group = np.where(group_starts > 0, hits[group_starts - 1], 0)
+    hits_in_group = hits - np.repeat(hits_before_group, sizes)
+    precision_at_rank = hits_in_group / (positions + 1)
+
+    metrics = {"group_id": groups, "size": sizes}
+    for k in cutoffs:
+        in_top_k = positions < k
+        dcg = np.bincount(codes, weights=tie_gains * discounts * in_top_k, minlength=group_count)
+        idcg = np.bincount(ideal_codes, weights=ideal_gains * ideal_discounts * (ideal_positions < k), minlength=group_count)
+        hits_at_k = np.bincount(codes, weights=relevant * in_top_k, minlength=group_count)
+        ap_sum = np.bincount(codes, weights=relevant * in_top_k * precision_at_rank, minlength=group_count)
+
+        metrics[f"NDCG@{k}"] = np.divide(dcg, idcg, out=np.zeros(group_count), where=idcg > 0)
+        metrics[f"Precision@{k}"] = hits_at_k / np.minimum(sizes, k)
+        metrics[f"Recall@{k}"] = np.divide(hits_at_k, total_relevant, out=np.zeros(group_count), where=total_relevant > 0)
+        ap_norm = np.minimum(total_relevant, k)
+        metrics[f"MAP@{k}"] = np.divide(ap_sum, ap_norm, out=np.zeros(group_count), where=ap_norm > 0)
+
+    first_relevant = np.full(group_count, np.inf)
+    relevant_codes, first_index = np.unique(codes[relevant], return_index=True)
+    first_relevant[relevant_codes] = positions[relevant][first_index]
+    metrics["MRR"] = 1 / (first_relevant + 1)
+
+    return pd.DataFrame(metrics)
+
+
+def evaluate_ranking(y_true, y_score, group_ids, cutoffs=DEFAULT_CUTOFFS, slices=(), relevance_threshold=None, contiguous=False) -> dict:
+    """Every ranking metric of one scored dataset as a single JSON serializable result.
+
+    `global` ranks all rows as one list, `groupwise` averages the groups holding more than one item
+    and `slices` holds the metrics of the requested groups (ex. validation categories).
+    """
+    groups = groupwise_ranking_metrics(y_true, y_score, group_ids, cutoffs, relevance_threshold, contiguous)
+    overall = groupwise_ranking_metrics(y_true, y_score, np.zeros(np.size(y_true), dtype=int), cutoffs, relevance_threshold, contiguous=True)
+    metric_columns = [column for column in groups.columns if column not in ("group_id", "size")]
+
+    def as_dict(row) -> dict:
+        return {column: float(row[column]) for column in metric_columns}
+
+    ranked_groups = groups[groups["size"] > 1]
+    slice_rows = {str(group_id): index for index, group_id in enumerate(groups["group_id"])}
+
+    return {
+        "cutoffs": list(cutoffs),
+        "relevance_threshold": None if relevance_threshold is None else float(relevance_threshold),
+        "rows": int(groups["size"].sum()),
+        "groups": int(len(ranked_groups)),
+        "global": as_dict(overall.iloc[0]) if len(overall) else {},
+        "groupwise": {column: float(ranked_groups[column].mean()) for column in metric_columns} if len(ranked_groups) else {},
+        "slices": {
+            str(group_id): as_dict(groups.iloc[slice_rows[str(group_id)]])
+            for group_id in slices if str(group_id) in slice_rows
+        },
+    }
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from sklearn.metrics import ndcg_score
+from ranking_metrics import evaluate_ranking, groupwise_ranking_metrics
+
+
+def per_group_reference(y_true, y_score, group_ids, k):
+    """The per-group loop the engine replaced: sklearn's ndcg_score and the ranked list metrics of every group."""
+    results = {}
+    for group in np.unique(group_ids):
+        mask = group_ids == group
+        y_true_sorted = y_true[mask][np.argsort(-y_score[mask], kind="stable")]
+        relevant = y_true_sorted > 0
+        total_relevant = relevant.sum()
+        hits = np.cumsum(relevant)
+        precision_at_rank = hits / np.arange(1, len(relevant) + 1)
+        results[group] = {
+            f"NDCG@{k}": ndcg_score([y_true[mask]], [y_score[mask]], k=k) if mask.sum() > 1 else None,
+            f"Precision@{k}": relevant[:k].mean(),
+            f"Recall@{k}": relevant[:k].sum() / total_relevant if total_relevant else 0.0,
+            f"MAP@{k}": (precision_at_rank[:k] * relevant[:k]).sum() / min(total_relevant, k) if total_relevant else 0.0,
+            "MRR": 1 / (np.argmax(relevant) + 1) if total_relevant else 0.0,
+        }
+    return results
+
+
+@pytest.mark.parametrize("contiguous", [False, True])
+@pytest.mark.parametrize("k", [1, 3, 10])
+def test_groupwise_metrics_match_the_per_group_loop(contiguous, k):
+    random = np.random.default_rng(7)
+    group_ids = np.sort(random.integers(0, 30, size=600)) if contiguous else random.integers(0, 30, size=600)
+    y_true = random.integers(0, 4, size=600).astype(float)
+    # few distinct scores, so most groups hold ties
+    y_score = random.integers(0, 5, size=600).astype(float)
+    # groups without any relevant item
+    y_true[np.isin(group_ids, [3, 11])] = 0
+
+    metrics = groupwise_ranking_metrics(y_true, y_score, group_ids, cutoffs=[k], contiguous=contiguous)
+    reference = per_group_reference(y_true, y_score, group_ids, k)
+
+    assert list(metrics["group_id"]) == sorted(reference)
+    for row in metrics.to_dict("records"):
+        expected = reference[row["group_id"]]
+        for metric, value in expected.items():
+            if value is not None:
+                assert row[metric] == pytest.approx(value, abs=1e-12), (row["group_id"], metric)
+    assert (metrics.loc[metrics["group_id"].isin([3, 11]), [f"NDCG@{k}", f"Recall@{k}", f"MAP@{k}", "MRR"]] == 0).all().all()
+
+
+def test_empty_input_returns_no_groups():
+    metrics = groupwise_ranking_metrics(np.array([]), np.array([]), np.array([]), cutoffs=[5])
+    assert len(metrics) == 0
+    assert {"group_id", "size", "NDCG@5", "MAP@5", "MRR"} <= set(metrics.columns)
+
+    result = evaluate_ranking(np.array([]), np.array([]), np.array([]), cutoffs=[5], slices=[1113], contiguous=True)
+    assert result["rows"] == 0 and result["global"] == {} and result["groupwise"] == {} and result["slices"] == {}
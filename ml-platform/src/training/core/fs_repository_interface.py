@@ -2,36 +2,92 @@ import pandas as pd
 from kink import inject
 import json
 import os
-import pickle
 import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from dataset_schema import resolve_schema
+from storage_format import resolve_storage_format
+from prediction_writer import PredictionWriter
+from step_cache import StepCache
 
 
 @inject()
 class FileSystemRepository():
-    def __init__(self, input_path: str, output_path: str, config_path: str, model_path: str, analysis: bool = False) -> None:
+    def __init__(self, input_path: str, output_path: str, config_path: str, model_path: str, analysis: bool = False, storage_format: str = "parquet", model_packaging: bool = False, step_cache: StepCache | None = None, prediction_queue_size: int = 4) -> None:
         self.input_path = input_path
         self.output_path = output_path
         self.config_path = config_path
         self.model_path = model_path
         self.analysis = analysis
+        self.storage_format = storage_format
+        self.model_packaging = model_packaging
+        # a single writer thread keeps artifact writes off the fit loop and in submission order
+        self.model_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-writer")
+        self.model_writes = []
+        # models saved by this run, the only ones packaged
+        self.saved_models = []
+        self.prediction_writer = PredictionWriter(prediction_queue_size)
+        self.step_cache = step_cache
+        # every artifact written by this run, stored together in the step cache
+        self.outputs = []
 
     def save(self, data: pd.DataFrame, path: str, index: bool = False, force: bool = False) -> None:
         if self.analysis or force:
-            data.to_csv(f'{self.output_path}/{path}', index=index)
+            data = resolve_schema(path).apply(data.reset_index() if index else data, strict=True)
+            path, storage_format = resolve_storage_format(path, self.storage_format)
+            storage_format.write(data, f'{self.output_path}/{path}', index=False)
+            self.outputs.append(("output", path))
 
-    def read(self, path: str) -> pd.DataFrame:
-        return pd.read_csv(f'{self.input_path}/{path}')
+    def read(self, path: str, columns: list | None = None, filters: list | None = None) -> pd.DataFrame:
+        schema = resolve_schema(path)
+        path, storage_format = resolve_storage_format(path, self.storage_format)
+        return schema.apply(storage_format.read(f'{self.input_path}/{path}', columns=columns, filters=filters, dtypes=schema.dtypes))
     
+    def read_groups(self, path: str) -> pd.DataFrame | None:
+        """Group boundaries written alongside a dataset sorted by group, None when the dataset has no group layout."""
+        path, storage_format = resolve_storage_format(f'{path}.groups', self.storage_format)
+        if not os.path.exists(f'{self.input_path}/{path}'):
+            return None
+        return storage_format.read(f'{self.input_path}/{path}')
+
+    def save_predictions(self, rows, scores, path: str, score_column: str) -> None:
+        """`(row, score)` of the rows of a dataset scored by a model, written in the background as compressed parquet."""
+        self.prediction_writer.write(f'{self.output_path}/{path}.parquet', rows, scores, score_column)
+        self.outputs.append(("output", f'{path}.parquet'))
+
+    def save_soft_labels(self, rows, scores, prefix: str, dataset: str) -> None:
+        """Teacher scores of every row, kept in the output so a later run can distill without refitting the teacher."""
+        self.save_predictions(rows, scores, f'soft_labels/{prefix}-{dataset}', "pred_score")
+
+    def read_soft_labels(self, prefix: str, dataset: str) -> pd.DataFrame:
+        # soft labels of this run may still be queued
+        self.prediction_writer.flush()
+        path, storage_format = resolve_storage_format(f'soft_labels/{prefix}-{dataset}.parquet', self.storage_format)
+        return storage_format.read(f'{self.output_path}/{path}')
+
     def file_exists(self, file: str) -> bool:
         return os.path.exists(f'{self.input_path}/{file}')
 
-    def save_models(self, dict_package, filename: str):
-        path_to_model = f"{self.model_path}/{filename}.pkl"
-        with open(path_to_model, "wb") as f:
-            pickle.dump(dict_package, f)
-        output_tar_gz = f"{self.model_path}/{filename}.tar.gz"
-        with tarfile.open(output_tar_gz, "w:gz") as tar:
-            tar.add(path_to_model, arcname=os.path.basename(path_to_model))
+    def save_models(self, model, filename: str):
+        # CatBoost does not document concurrent use of a model, the writer saves its own copy while the caller keeps predicting
+        self.model_writes.append(self.model_writer.submit(model.copy().save_model, f"{self.model_path}/{filename}.cbm", format="cbm"))
+        self.saved_models.append(f"{filename}.cbm")
+        self.outputs.append(("models", f"{filename}.cbm"))
+
+    def package_models(self, archive: str = "model.tar.gz"):
+        # models of earlier runs or other grids may share the folder, only the ones saved by this run are bundled
+        with tarfile.open(f"{self.model_path}/{archive}", "w:gz") as tar:
+            for model in sorted(set(self.saved_models)):
+                tar.add(f"{self.model_path}/{model}", arcname=model)
+        self.outputs.append(("models", archive))
+
+    def finalize_models(self):
+        if self.model_packaging:
+            self.model_writes.append(self.model_writer.submit(self.package_models))
+        self.model_writer.shutdown(wait=True)
+        self.prediction_writer.close()
+        # surfaces the first failed write
+        for write in self.model_writes:
+            write.result()
 
     def get_hyperparameters(self, path: str):
         with open(f'{self.input_path}/{path}', "r") as f:
@@ -40,4 +96,27 @@ class FileSystemRepository():
     def save_metrics(self, metrics: dict, path:str, filename: str):
         metrics_json = json.dumps(metrics, indent=4)
         with open(f"{self.output_path}/{path}/{filename}", 'w') as outfile:
-            outfile.write(metrics_json)
\ No newline at end of file
+            outfile.write(metrics_json)
+        self.outputs.append(("output", f"{path}/{filename}"))
+
+    def read_metrics(self, path: str, filename: str) -> dict:
+        with open(f"{self.output_path}/{path}/{filename}", "r") as f:
+            return json.load(f)
+
+    def get_cache_key(self, datasets: list[str], config: dict) -> str | None:
+        """Step cache key of a run over the `datasets` (with their group layouts), None when no step cache is configured."""
+        if self.step_cache is None:
+            return None
+        inputs = {}
+        for dataset in datasets:
+            for path in (dataset, f'{dataset}.groups'):
+                path, _ = resolve_storage_format(path, self.storage_format)
+                inputs[path] = f'{self.input_path}/{path}'
+        config = {**config, "storage_format": self.storage_format, "analysis": self.analysis, "model_packaging": self.model_packaging}
+        return self.step_cache.fingerprint(inputs, config, os.path.dirname(os.path.abspath(__file__)))
+
+    def restore_outputs(self, key: str) -> bool:
+        return self.step_cache.restore(key, {"output": self.output_path, "models": self.model_path})
+
+    def store_outputs(self, key: str) -> None:
+        self.step_cache.store(key, {"output": self.output_path, "models": self.model_path}, self.outputs)
@@ -0,0 +1,38 @@
+import os
+import time
+from catboost import CatBoostRanker, Pool
+from profiler import peak_rss_mb
+
+EVAL_METRIC = "NDCG:top=5;hints=skip_train~false"
+
+
+def get_grid_resources(workers: int, tasks: int) -> tuple[int, int]:
+    """Sizes the fit pool and the CatBoost threads of each fit so that together they never exceed the available cores."""
+    cores = os.cpu_count() or 1
+    workers = max(1, min(workers or cores, tasks))
+    return workers, max(1, cores // workers)
+
+
+def get_eval_score(ranking_model: CatBoostRanker) -> float:
+    validation = ranking_model.get_best_score().get("validation", {})
+    return next((score for metric, score in validation.items() if metric.startswith("NDCG:top=5")), float("-inf"))
+
+
+def fit_ranker(train_data: dict, test_data: dict, params: dict, thread_count: int) -> tuple[CatBoostRanker, dict]:
+    """Fits one candidate in a fit worker, with the span of the fit (wall time, training rows, worker peak memory) for the parent's profile."""
+    started = time.perf_counter()
+    # Pools wrap native handles and cannot be pickled, each worker builds them from the raw frames
+    train_pool = Pool(**train_data)
+    ranking_model = CatBoostRanker(
+            **{"thread_count": thread_count, **params},
+            verbose=500,
+            # metric_period=50,
+            eval_metric=EVAL_METRIC,
+        )
+
+    ranking_model.fit(
+            train_pool,
+            eval_set=Pool(**test_data),
+        )
+
+    return ranking_model, dict(seconds=time.perf_counter() - started, rows=train_pool.num_row(), peak_rss=peak_rss_mb())
@@ -6,26 +6,64 @@ from logging import Logger
 from model_trainer import ModelTrainer
 from fs_repository_interface import FileSystemRepository
 from logger import LoggerFactory
+from profiler import Profiler
+from step_cache import StepCache
 
 LOGLEVEL = os.getenv('LOGLEVEL')
+DATA_PATH = os.getenv('DATA_PATH')
 MODE = os.getenv('MODE')
+STORAGE_FORMAT = os.getenv('STORAGE_FORMAT')
+GRID_WORKERS = os.getenv('GRID_WORKERS')
+SEARCH_MODE = os.getenv('SEARCH_MODE')
+HALVING_MIN_ITERATIONS = os.getenv('HALVING_MIN_ITERATIONS')
+HALVING_FACTOR = os.getenv('HALVING_FACTOR')
+POOL_CACHE_PATH = os.getenv('POOL_CACHE_PATH')
+MODEL_PACKAGING = os.getenv('MODEL_PACKAGING')
+MAX_COUNT = os.getenv('MAX_COUNT')
+POOL_SHARD_SIZE = os.getenv('POOL_SHARD_SIZE')
+TRAINING_STAGE = os.getenv('TRAINING_STAGE')
+DISTILL_TEACHERS = os.getenv('DISTILL_TEACHERS')
+DISTILL_TARGET = os.getenv('DISTILL_TARGET')
+STEP_CACHE_PATH = os.getenv('STEP_CACHE_PATH')
+STEP_CACHE_MAX_MB = os.getenv('STEP_CACHE_MAX_MB')
+PREDICTION_QUEUE_SIZE = os.getenv('PREDICTION_QUEUE_SIZE')
 
-inputPath = '../../../data' #'/opt/ml/processing/input/data'
-outputPath = '../../../data' #'/opt/ml/processing/output/data'
-modelPath = '../../../data/models' #"/opt/ml/model/"
+dataPath = DATA_PATH or '../../../data'
+inputPath = dataPath #'/opt/ml/processing/input/data'
+outputPath = dataPath #'/opt/ml/processing/output/data'
+modelPath = f'{dataPath}/models' #"/opt/ml/model/"
 
 di[Logger] = LoggerFactory.create_logger(LOGLEVEL or "INFO")
+di[Profiler] = Profiler("training")
 di[FileSystemRepository] = FileSystemRepository(
     inputPath,
     outputPath,
     inputPath,
     modelPath,
-    MODE == "DEVELOPMENT"
+    MODE == "DEVELOPMENT",
+    STORAGE_FORMAT or "parquet",
+    MODEL_PACKAGING == "true",
+    StepCache(STEP_CACHE_PATH, int(STEP_CACHE_MAX_MB or 10240)) if STEP_CACHE_PATH else None,
+    int(PREDICTION_QUEUE_SIZE or 4)
 )
+di[Profiler].instrument(di[FileSystemRepository], prefix="repository")
+di["grid_workers"] = int(GRID_WORKERS or 0)
+di["search_mode"] = SEARCH_MODE or "grid"
+di["halving_min_iterations"] = int(HALVING_MIN_ITERATIONS or 500)
+di["halving_factor"] = int(HALVING_FACTOR or 3)
+di["pool_cache_path"] = POOL_CACHE_PATH
+di["max_count"] = int(MAX_COUNT or ModelTrainer.MAX_COUNT)
+di["pool_shard_size"] = int(POOL_SHARD_SIZE or 0)
+di["training_stage"] = TRAINING_STAGE or "all"
+di["distill_teachers"] = int(DISTILL_TEACHERS or 1)
+di["distill_target"] = DISTILL_TARGET or "quantile"
 
 def main():
     trainer = ModelTrainer()
-    trainer.train()
+    try:
+        trainer.train()
+    finally:
+        di[Profiler].save(f"{outputPath}/metrics")
 
 if __name__ == "__main__":
     main()
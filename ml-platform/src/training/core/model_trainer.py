@@ -1,11 +1,15 @@
+import math
 from logging import Logger
 import numpy as np
 from kink import inject
 import fireducks.pandas as pd
-from pandas import DataFrame
 from sklearn.model_selection import ParameterGrid
-from catboost import CatBoostRanker, Pool
+from concurrent.futures import ProcessPoolExecutor
 from fs_repository_interface import FileSystemRepository
+from grid_search import fit_ranker, get_eval_score, get_grid_resources
+from pool_cache import PoolCache
+from profiler import Profiler
+from storage_format import group_layout
 
 @inject()
 class ModelTrainer:
@@ -23,62 +27,122 @@ class ModelTrainer:
     ]
     STUDENT_FEATURES=[ "category", "price" ]
 
-    def __init__(self, repository: FileSystemRepository, logger: Logger) -> None:
+    def __init__(self, repository: FileSystemRepository, logger: Logger, profiler: Profiler, grid_workers: int = 0, search_mode: str = "grid", halving_min_iterations: int = 500, halving_factor: int = 3, pool_cache_path: str | None = None, max_count: int = MAX_COUNT, pool_shard_size: int = 0, training_stage: str = "all", distill_teachers: int = 1, distill_target: str = "quantile") -> None:
         self.repository = repository
         self.logger = logger
+        self.profiler = profiler
+        self.grid_workers = grid_workers
+        self.search_mode = search_mode
+        self.halving_min_iterations = halving_min_iterations
+        self.halving_factor = halving_factor
+        self.pool_cache_path = pool_cache_path
+        self.max_count = max_count
+        self.pool_shard_size = pool_shard_size
+        self.training_stage = training_stage
+        self.distill_teachers = distill_teachers
+        self.distill_target = distill_target
 
     def categorize_columns(self, df, category_features):
+        # CatBoost hashes categorical values as it does their strings, the compact categorical dtype is kept
         for col in category_features:
-            df[col] = df[col].astype("category").astype(str)
+            df[col] = df[col].astype("category")
 
         return df
 
-    def get_stds(self, df, features, target, grouping):
-        X = df[features]
-        X_std = X.iloc[:self.MAX_COUNT].copy()
-        X_std = X_std.sort_values(by=grouping)
-        y_std = df[target].iloc[:self.MAX_COUNT].fillna(0)
+    def read_group_sizes(self, dataset):
+        groups = self.repository.read_groups(dataset)
+        return None if groups is None else groups["length"].to_numpy()
+
+    def get_group_sizes(self, df, grouping):
+        # std frames are contiguous by group, their run lengths are the group sizes
+        return group_layout(df[grouping[0]].to_numpy())["length"].to_numpy()
+
+    def get_stds(self, df, features, target, grouping, group_sizes=None):
+        if group_sizes is not None:
+            # rows are already contiguous by group, whole groups are sliced off the top without sorting
+            if self.max_count and len(df) > self.max_count:
+                kept = np.cumsum(group_sizes) <= self.max_count
+                kept[0] = True
+                df = df.iloc[:group_sizes[kept].sum()]
+
+            X_std = df[features].copy()
+            y_std = df[target].fillna(0)
+        else:
+            if self.max_count and len(df) > self.max_count:
+                # whole groups are kept, in order of first appearance, so no ranking group is cut short
+                groups = df.groupby(grouping, sort=False, observed=True).ngroup().to_numpy()
+                kept = np.cumsum(np.bincount(groups)) <= self.max_count
+                kept[0] = True
+                df = df[kept[groups]]
+
+            X_std = df[features].sort_values(by=grouping)
+            y_std = df.loc[X_std.index, target].fillna(0)
+
         group_ids = X_std[grouping]
         return X_std, y_std, group_ids
 
-    def train_with_params(self, train_pool, test_pool, params, model_type):
-        self.logger.debug(f"[Training]: Hyper Params: \n {params}")
+    def get_pool_data(self, X, y, group_ids, features):
+        # frames are copied since queued fits are pickled lazily, after the caller may have added prediction columns,
+        # sharded pools are written to a pool file right away instead
+        return dict(data=X if self.pool_shard_size else X.copy(), label=y, group_id=group_ids, cat_features=self.GROUPINGS, feature_names=features)
+
+    def train_with_params(self, executor, train_data, test_data, params, model_type, thread_count):
+        self.logger.debug("[Training]: Hyper Params: \n %s", params)
 
         model_prefix = f"{params['loss_function']}-{params['depth']}-{params['l2_leaf_reg']}-{params['learning_rate']}-{model_type}"
         self.logger.info(f"[Training]: Model Prefix: {model_prefix}")
-        ranking_model = CatBoostRanker(
-                **params,
-                verbose=500,
-                # metric_period=50,
-                eval_metric="NDCG:top=5;hints=skip_train~false",
-            )
 
-        ranking_model.fit(
-                train_pool,
-                eval_set=test_pool,
-            )
+        return model_prefix, self.profiler.track("fit", executor.submit(fit_ranker, train_data, test_data, params, thread_count))
+
+    def select_candidates(self, executor, train_data, test_data, grid, model_type, thread_count):
+        if self.search_mode != "halving":
+            return grid
+
+        candidates = list(grid)
+        budget = self.halving_min_iterations
+        rungs = []
 
-        return model_prefix, ranking_model
+        # successive halving: every candidate gets a small iteration budget, the best fraction on the eval NDCG moves up
+        while len(candidates) > 1 and budget < max(params.get("iterations", 1000) for params in candidates):
+            fits = [
+                self.train_with_params(executor, train_data, test_data, {**params, "iterations": budget}, model_type, thread_count)
+                for params in candidates
+            ]
+            scores = [(model_prefix, get_eval_score(fit.result())) for model_prefix, fit in fits]
+            promoted = sorted(range(len(candidates)), key=lambda index: -scores[index][1])[:math.ceil(len(candidates) / self.halving_factor)]
 
-    def evaluate_model(self, df, ranking_model, categorical_columns, features, target, model_name):
+            rungs.append({"iterations": budget, "scores": dict(scores), "promoted": [scores[index][0] for index in sorted(promoted)]})
+            self.logger.info(f"[Training]: Halving rung of {budget} iterations promoted {len(promoted)}/{len(candidates)} {model_type} candidates")
+
+            candidates = [candidates[index] for index in sorted(promoted)]
+            budget *= self.halving_factor
+
+        self.repository.save_metrics({"rungs": rungs}, "metrics", f"successive_halving-{model_type}.json")
+        return candidates
+
+    def evaluate_model(self, df, ranking_model, categorical_columns, features, target, model_name, dataset="testing", group_sizes=None):
         binary_target = f"{target}_binary"
-        threshold = np.percentile(df[target], 30)
-        df[binary_target] = (df[target] >= threshold).astype(int)
-
-        X_test_std, y_test_std, group_ids_test = self.get_stds(df, features, binary_target, categorical_columns)
-        evaluation_test_pool = Pool(X_test_std, label=y_test_std, group_id=group_ids_test, cat_features=categorical_columns)
-
-        metrics = ranking_model.eval_metrics(
-                evaluation_test_pool,
-                metrics=[
-                    "NDCG:top=5",
-                    "PrecisionAt:top=5",
-                    "RecallAt:top=5",
-                    "MAP:top=5",
-                    "MRR:top=5",
-                    "ERR:top=5",
-                    ]
-            )
+
+        def build_evaluation_data():
+            threshold = np.nanpercentile(df[target], 30)
+            df[binary_target] = (df[target] >= threshold).astype(int)
+            X_test_std, y_test_std, group_ids_test = self.get_stds(df, features, binary_target, categorical_columns, group_sizes)
+            return self.get_pool_data(X_test_std, y_test_std, group_ids_test, features)
+
+        evaluation_test_pool = self.pool_cache.get(dataset, features, binary_target, build_evaluation_data)
+
+        with self.profiler.span("evaluate", evaluation_test_pool.num_row()):
+            metrics = ranking_model.eval_metrics(
+                    evaluation_test_pool,
+                    metrics=[
+                        "NDCG:top=5",
+                        "PrecisionAt:top=5",
+                        "RecallAt:top=5",
+                        "MAP:top=5",
+                        "MRR:top=5",
+                        "ERR:top=5",
+                        ]
+                )
 
         self.repository.save_metrics(metrics, "metrics", f"{model_name}.json")
 
@@ -91,12 +155,118 @@ class ModelTrainer:
         self.logger.info(f"[Training]: Best Score {ranking_model.get_best_score()}")
         self.logger.info(f"[Training]: Best Iteration {ranking_model.get_best_iteration()}")
 
+    def train_teachers(self, executor, grid, thread_count, df_test, X_train_std, X_test_std, test_group_sizes):
+        train_pool = self.pool_cache.get("training", self.FULL_FEATURES, self.TARGET_LABEL, None)
+        test_pool = self.pool_cache.get("testing", self.FULL_FEATURES, self.TARGET_LABEL, None)
+        train_data = self.pool_cache.get_data("training", self.FULL_FEATURES, self.TARGET_LABEL)
+        test_data = self.pool_cache.get_data("testing", self.FULL_FEATURES, self.TARGET_LABEL)
+
+        # every teacher is queued upfront, results are consumed in grid order so outputs stay deterministic
+        teacher_fits = [
+            self.train_with_params(executor, train_data, test_data, params, 'teacher', thread_count)
+            for params in self.select_candidates(executor, train_data, test_data, grid, 'teacher', thread_count)
+        ]
+
+        teacher_scores = {}
+        for model_prefix, teacher_fit in teacher_fits:
+            ranking_model = teacher_fit.result()
+            self.log_training_feature_evals(train_pool, ranking_model, self.FULL_FEATURES)
+            self.repository.save_models(ranking_model, f"model-{model_prefix}")
+            self.evaluate_model(df_test, ranking_model, self.GROUPINGS, self.FULL_FEATURES, self.TARGET_LABEL, model_prefix, group_sizes=test_group_sizes)
+            teacher_scores[model_prefix] = get_eval_score(ranking_model)
+
+            self.logger.debug(f"[Training]: Making predictions")
+            # predictions follow the group sorted pool rows, they are aligned back to the frames by index
+            with self.profiler.span("predict", train_pool.num_row() + test_pool.num_row()):
+                predictions = {"training": ranking_model.predict(train_pool), "testing": ranking_model.predict(test_pool)}
+
+            # soft labels are kept once per teacher, keyed by the original row, for the distillation stage and as the teacher's predictions
+            for dataset, X_std in (("training", X_train_std), ("testing", X_test_std)):
+                self.repository.save_soft_labels(X_std.index, predictions[dataset], model_prefix, dataset)
+
+        self.repository.save_metrics({"teachers": teacher_scores}, "metrics", "teachers.json")
+        return teacher_scores
+
+    def get_soft_labels(self, teacher_prefix, dataset, X_std):
+        soft_labels = self.repository.read_soft_labels(teacher_prefix, dataset)
+        return soft_labels.set_index("row")[self.PREDICTION_LABEL].reindex(X_std.index)
+
+    def distill(self, executor, grid, thread_count, df_test, X_train_std, X_test_std, test_group_sizes, teacher_scores=None):
+        teacher_scores = teacher_scores or self.repository.read_metrics("metrics", "teachers.json")["teachers"]
+        teachers = sorted(teacher_scores, key=lambda teacher_prefix: -teacher_scores[teacher_prefix])[:self.distill_teachers]
+        self.logger.info(f"[Training]: Distilling {len(teachers)}/{len(teacher_scores)} teachers into {self.distill_target} targets")
+
+        std_train_group_sizes = self.get_group_sizes(X_train_std, self.GROUPINGS)
+        std_test_group_sizes = self.get_group_sizes(X_test_std, self.GROUPINGS)
+
+        distillations = []
+        for rank, teacher_prefix in enumerate(teachers):
+            soft_labels = self.get_soft_labels(teacher_prefix, "testing", X_test_std)
+            X_train_std[self.PREDICTION_LABEL] = self.get_soft_labels(teacher_prefix, "training", X_train_std)
+            X_test_std[self.PREDICTION_LABEL] = soft_labels
+
+            if self.distill_target == "quantile":
+                X_train_std[self.PREDICTION_LABEL] = pd.qcut(X_train_std[self.PREDICTION_LABEL], q=4, labels=False)
+                X_test_std[self.PREDICTION_LABEL] = pd.qcut(X_test_std[self.PREDICTION_LABEL], q=4, labels=False)
+
+            X_student_train_std, y_student_train_std, group_student_ids_train = self.get_stds(X_train_std, self.STUDENT_FEATURES, self.PREDICTION_LABEL, self.GROUPINGS, std_train_group_sizes)
+            X_student_test_std, y_student_test_std, group_student_ids_test = self.get_stds(X_test_std, self.STUDENT_FEATURES, self.PREDICTION_LABEL, self.GROUPINGS, std_test_group_sizes)
+
+            # student labels come from this teacher, so its pools are cached under the teacher's prefix
+            student_train_set, student_test_set = f"training-{teacher_prefix}", f"testing-{teacher_prefix}"
+            self.pool_cache.get(student_train_set, self.STUDENT_FEATURES, self.PREDICTION_LABEL, lambda: self.get_pool_data(X_student_train_std, y_student_train_std, group_student_ids_train, self.STUDENT_FEATURES), quantize=True)
+            self.pool_cache.get(student_test_set, self.STUDENT_FEATURES, self.PREDICTION_LABEL, lambda: self.get_pool_data(X_student_test_std, y_student_test_std, group_student_ids_test, self.STUDENT_FEATURES))
+            student_train_data = self.pool_cache.get_data(student_train_set, self.STUDENT_FEATURES, self.PREDICTION_LABEL)
+            student_test_data = self.pool_cache.get_data(student_test_set, self.STUDENT_FEATURES, self.PREDICTION_LABEL)
+
+            # students of the best teacher keep the plain student name, the others carry their teacher's prefix
+            model_type = 'student' if rank == 0 else f'student-of-{teacher_prefix}'
+            student_fits = [
+                self.train_with_params(executor, student_train_data, student_test_data, student_params, model_type, thread_count)
+                for student_params in self.select_candidates(executor, student_train_data, student_test_data, grid, model_type, thread_count)
+            ]
+            distillations.append((teacher_prefix, soft_labels, student_train_set, student_test_set, student_fits))
+
+        students = {}
+        for teacher_prefix, soft_labels, student_train_set, student_test_set, student_fits in distillations:
+            # student evaluations rank the test items by the raw scores of their own teacher
+            df_test[self.PREDICTION_LABEL] = soft_labels
+            student_train_pool = self.pool_cache.get(student_train_set, self.STUDENT_FEATURES, self.PREDICTION_LABEL, None)
+
+            for student_prefix, student_fit in student_fits:
+                student_model = student_fit.result()
+                self.log_training_feature_evals(student_train_pool, student_model, self.STUDENT_FEATURES)
+                self.repository.save_models(student_model, f"model-{student_prefix}")
+                students[student_prefix] = teacher_prefix
+                self.evaluate_model(df_test, student_model, self.GROUPINGS, self.STUDENT_FEATURES, self.PREDICTION_LABEL, student_prefix, student_test_set, test_group_sizes)
+
+            self.pool_cache.release(student_train_set)
+            self.pool_cache.release(student_test_set)
+
+        # the students actually fit, with the teacher they were distilled from, so testing does not rebuild the (halved) grid
+        self.repository.save_metrics({"students": students}, "metrics", "students.json")
+
     def train(self):
         self.logger.info(f"[Training]: Starting Training...")
 
         hyperParameters = self.repository.get_hyperparameters("input/hyperparameters.json")
-        df_train = self.repository.read("training.csv")
-        df_test = self.repository.read("testing.csv")
+
+        # a distill only run reads the soft labels of an earlier run, it is not keyed on its inputs alone
+        cache_key = None if self.training_stage == "distill" else self.repository.get_cache_key(["training", "testing"], {
+            "hyperparameters": hyperParameters,
+            "search_mode": self.search_mode,
+            "halving_min_iterations": self.halving_min_iterations,
+            "halving_factor": self.halving_factor,
+            "max_count": self.max_count,
+            "training_stage": self.training_stage,
+            "distill_teachers": self.distill_teachers,
+            "distill_target": self.distill_target,
+        })
+        if cache_key and self.repository.restore_outputs(cache_key):
+            self.logger.info(f"[Training]: Inputs unchanged since step cache entry {cache_key}, restored its models and metrics")
+            return
+        df_train = self.repository.read("training", columns=self.FULL_FEATURES + [self.TARGET_LABEL])
+        df_test = self.repository.read("testing", columns=self.FULL_FEATURES + [self.TARGET_LABEL])
 
         df_train = self.categorize_columns(df_train, self.GROUPINGS)
         df_test = self.categorize_columns(df_test, self.GROUPINGS)
@@ -105,50 +275,27 @@ class ModelTrainer:
         self.logger.info(f"[Training]: Feature columns: {self.FULL_FEATURES}")
         self.logger.info(f"[Training]: Student Feature columns: {self.STUDENT_FEATURES}")
 
-        X_train_std, y_train_std, group_ids_train = self.get_stds(df_train, self.FULL_FEATURES, self.TARGET_LABEL, self.GROUPINGS)
-        X_test_std, y_test_std, group_ids_test = self.get_stds(df_test, self.FULL_FEATURES, self.TARGET_LABEL, self.GROUPINGS)
-
-        train_pool = Pool(X_train_std, label=y_train_std, group_id=group_ids_train, cat_features=self.GROUPINGS, feature_names=self.FULL_FEATURES)
-        test_pool = Pool(X_test_std, label=y_test_std, group_id=group_ids_test, cat_features=self.GROUPINGS, feature_names=self.FULL_FEATURES)
-
-        for params in ParameterGrid(hyperParameters):
-
-            model_prefix, ranking_model = self.train_with_params(train_pool, test_pool, params, 'teacher')
-            self.log_training_feature_evals(train_pool, ranking_model, self.FULL_FEATURES)
-            self.repository.save_models(ranking_model, f"model-{model_prefix}")
-            self.evaluate_model(df_test, ranking_model, self.GROUPINGS, self.FULL_FEATURES, self.TARGET_LABEL, model_prefix)
-
-            self.logger.debug(f"[Training]: Making predictions")
-            y_pred_train = ranking_model.predict(train_pool)
-            df_train[self.PREDICTION_LABEL] = X_train_std[self.PREDICTION_LABEL] = y_pred_train
-
-            y_pred_test = ranking_model.predict(test_pool)
-            df_test[self.PREDICTION_LABEL] = X_test_std[self.PREDICTION_LABEL] = y_pred_test
-
-            self.repository.save(X_train_std, f"{model_prefix}_with_predictions.csv")
-            self.repository.save(X_test_std, f"{model_prefix}_testing_with_predictions.csv")
-
-            X_train_std[self.PREDICTION_LABEL] = pd.qcut(X_train_std[self.PREDICTION_LABEL], q=4, labels=False)
-            X_test_std[self.PREDICTION_LABEL] = pd.qcut(X_test_std[self.PREDICTION_LABEL], q=4, labels=False)
-
-            for student_params in ParameterGrid(hyperParameters):
-                self.logger.debug(f"[Training]: X_train_std: \n {X_train_std.head()}")
-                self.logger.debug(f"[Training]: X_test_std: \n {X_test_std.head()}")
-                self.logger.debug(f"[Training]: X_test_std: \n {df_test.head()}")
-
-
-                X_student_train_std, y_student_train_std, group_student_ids_train = self.get_stds(X_train_std, self.STUDENT_FEATURES, self.PREDICTION_LABEL, self.GROUPINGS)
-                X_student_test_std, y_student_test_std, group_student_ids_test = self.get_stds(X_test_std, self.STUDENT_FEATURES, self.PREDICTION_LABEL, self.GROUPINGS)
-
-                self.logger.debug(f"[Training]: Student X_train_std: \n {X_student_train_std.head()}")
-                self.logger.debug(f"[Training]: Student X_test_std: \n {X_student_test_std.head()}")
-
-                student_train_pool = Pool(X_student_train_std, label=y_student_train_std, group_id=group_student_ids_train, cat_features=self.GROUPINGS, feature_names=self.STUDENT_FEATURES)
-                student_test_pool = Pool(X_student_test_std, label=y_student_test_std, group_id=group_student_ids_test, cat_features=self.GROUPINGS, feature_names=self.STUDENT_FEATURES)
-
-                model_prefix, ranking_model = self.train_with_params(student_train_pool, student_test_pool, student_params, 'student')
-                self.log_training_feature_evals(student_train_pool, ranking_model, self.STUDENT_FEATURES)
-                self.repository.save_models(ranking_model, f"model-{model_prefix}")
-                self.evaluate_model(df_test, ranking_model, self.GROUPINGS, self.STUDENT_FEATURES, self.PREDICTION_LABEL, model_prefix)
-
-
+        test_group_sizes = self.read_group_sizes("testing")
+        X_train_std, y_train_std, group_ids_train = self.get_stds(df_train, self.FULL_FEATURES, self.TARGET_LABEL, self.GROUPINGS, self.read_group_sizes("training"))
+        X_test_std, y_test_std, group_ids_test = self.get_stds(df_test, self.FULL_FEATURES, self.TARGET_LABEL, self.GROUPINGS, test_group_sizes)
+
+        self.pool_cache = PoolCache(self.pool_cache_path, self.pool_shard_size, self.profiler)
+        if self.training_stage != "distill":
+            self.pool_cache.get("training", self.FULL_FEATURES, self.TARGET_LABEL, lambda: self.get_pool_data(X_train_std, y_train_std, group_ids_train, self.FULL_FEATURES), quantize=True)
+            self.pool_cache.get("testing", self.FULL_FEATURES, self.TARGET_LABEL, lambda: self.get_pool_data(X_test_std, y_test_std, group_ids_test, self.FULL_FEATURES))
+
+        grid = list(ParameterGrid(hyperParameters))
+        workers, thread_count = get_grid_resources(self.grid_workers, len(grid))
+        self.logger.info(f"[Training]: Grid of {len(grid)} candidates on {workers} workers with {thread_count} threads each")
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            teacher_scores = None
+            if self.training_stage != "distill":
+                teacher_scores = self.train_teachers(executor, grid, thread_count, df_test, X_train_std, X_test_std, test_group_sizes)
+            if self.training_stage != "teachers":
+                self.distill(executor, grid, thread_count, df_test, X_train_std, X_test_std, test_group_sizes, teacher_scores)
+
+        self.pool_cache.clear()
+        self.repository.finalize_models()
+        if cache_key:
+            self.repository.store_outputs(cache_key)
@@ -0,0 +1,91 @@
+import os
+import re
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from typing import Callable
+from catboost import Pool
+from profiler import Profiler
+
+
+class PoolCache:
+    """CatBoost pools keyed by (dataset, feature set, label), built once and shared by every fit and evaluation.
+
+    Training pools are quantized once and saved as quantized pool files, so process pool workers load them
+    instead of re-quantizing. Evaluation pools stay raw: categorical hashes of a separately quantized pool
+    would not match the ones the model was trained with.
+
+    With a `shard_size`, frames are written to a tab separated pool file `shard_size` rows at a time and CatBoost
+    parses the pool back from it instead of getting a copy of the frame. The frame is still whole in memory, so
+    this does not bound memory.
+    """
+
+    def __init__(self, cache_path: str | None = None, shard_size: int = 0, profiler: Profiler | None = None) -> None:
+        self.cache_path = cache_path or tempfile.mkdtemp(prefix="pools-")
+        self.owned = cache_path is None
+        self.shard_size = shard_size
+        self.pools = {}
+        self.profiler = profiler or Profiler("pools")
+        os.makedirs(self.cache_path, exist_ok=True)
+
+    def file_name(self, *parts) -> str:
+        return re.sub(r'[^A-Za-z0-9_.=-]+', '_', "-".join(str(part) for part in parts))
+
+    def write_pool_file(self, path: str, data: pd.DataFrame, label, group_id, cat_features: list, feature_names: list) -> dict:
+        with open(f"{path}.cd", "w") as outfile:
+            outfile.write("0\tLabel\n1\tGroupId\n")
+            for column, feature in enumerate(feature_names, start=2):
+                outfile.write(f"{column}\t{'Categ' if feature in cat_features else 'Num'}\t{feature}\n")
+
+        label, group_id = np.asarray(label).ravel(), np.asarray(group_id).ravel()
+        with open(f"{path}.tsv", "w") as outfile:
+            for start in range(0, len(data), self.shard_size):
+                shard = data.iloc[start:start + self.shard_size]
+                pd.concat([
+                    pd.DataFrame({"label": label[start:start + self.shard_size], "group_id": group_id[start:start + self.shard_size]}, index=shard.index),
+                    shard[feature_names],
+                ], axis=1).to_csv(outfile, sep="\t", header=False, index=False)
+
+        return dict(data=f"{path}.tsv", column_description=f"{path}.cd")
+
+    def get(self, dataset: str, features: list, label: str, build: Callable[[], dict], quantize: bool = False) -> Pool:
+        key = (dataset, tuple(features), label)
+        if key not in self.pools:
+            path = f"{self.cache_path}/{self.file_name(dataset, *features, label)}"
+            with self.profiler.span("pool.build") as span:
+                pool_data = build()
+                if self.shard_size:
+                    pool_data = self.write_pool_file(path, **pool_data)
+
+                pool = Pool(**pool_data)
+                span.rows = pool.num_row()
+            if quantize:
+                with self.profiler.span("pool.quantize", pool.num_row()):
+                    pool.quantize()
+                    pool.save(f"{path}.qpool")
+                self.remove_files(pool_data)
+                pool_data = dict(data=f"quantized://{path}.qpool")
+
+            self.pools[key] = (pool, pool_data)
+
+        return self.pools[key][0]
+
+    def get_data(self, dataset: str, features: list, label: str) -> dict:
+        """Picklable pool arguments for the fit workers, a quantized pool file path when the pool was quantized."""
+        return self.pools[(dataset, tuple(features), label)][1]
+
+    def remove_files(self, pool_data: dict) -> None:
+        for file in (pool_data["data"], pool_data.get("column_description")):
+            if isinstance(file, str):
+                os.remove(file.removeprefix("quantized://"))
+
+    def release(self, dataset: str) -> None:
+        for key in [key for key in self.pools if key[0] == dataset]:
+            _, pool_data = self.pools.pop(key)
+            self.remove_files(pool_data)
+
+    def clear(self) -> None:
+        self.pools.clear()
+        if self.owned:
+            shutil.rmtree(self.cache_path, ignore_errors=True)
@@ -0,0 +1,62 @@
+import os
+import queue
+import threading
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+_CLOSE = object()
+
+
+class PredictionWriter:
+    """Writes `(row, score)` prediction files as zstd compressed parquet from a background thread.
+
+    Rows are the ids of the scored rows in the dataset they were read from, so feature columns already on disk
+    are not written again. At most `queue_size` files wait to be written: a producer getting ahead of the disk
+    blocks instead of buffering without bound. The first failed write is raised by `flush` and `close`.
+    """
+
+    ROW_COLUMN = "row"
+
+    def __init__(self, queue_size: int = 4, compression: str = "zstd") -> None:
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.compression = compression
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name="prediction-writer", daemon=True)
+        self.thread.start()
+
+    def run(self) -> None:
+        while True:
+            item = self.queue.get()
+            try:
+                if item is _CLOSE:
+                    return
+                if self.error is None:
+                    file, table = item
+                    os.makedirs(os.path.dirname(file), exist_ok=True)
+                    pq.write_table(table, file, compression=self.compression)
+            except Exception as error:
+                self.error = error
+            finally:
+                self.queue.task_done()
+
+    def raise_error(self) -> None:
+        if self.error is not None:
+            raise self.error
+
+    def write(self, file: str, rows, scores, score_column: str) -> None:
+        self.raise_error()
+        # the arrays are copied, the caller is free to overwrite its frames once this returns
+        table = pa.table({self.ROW_COLUMN: np.array(rows, dtype=np.int64), score_column: np.array(scores, dtype=np.float32)})
+        self.queue.put((file, table))
+
+    def flush(self) -> None:
+        """Waits until every queued file is written."""
+        self.queue.join()
+        self.raise_error()
+
+    def close(self) -> None:
+        if self.thread.is_alive():
+            self.queue.put(_CLOSE)
+            self.thread.join()
+        self.raise_error()
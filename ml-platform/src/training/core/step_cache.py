@@ -0,0 +1,128 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+import time
+
+
+class StepCache:
+    """Content addressed store of stage outputs in a local directory.
+
+    Entries are keyed by the fingerprint of everything that produced them (input contents, stage config and
+    stage code), so a run whose fingerprint matches restores the outputs of the earlier run instead of
+    recomputing them. Past `max_size_mb`, the least recently used entries are evicted.
+    """
+
+    ENTRY_MANIFEST = "entry.json"
+    DIGESTS = "digests.json"
+
+    def __init__(self, cache_path: str, max_size_mb: int = 10240) -> None:
+        self.cache_path = cache_path
+        self.max_size = max_size_mb * (1 << 20)
+        os.makedirs(self.cache_path, exist_ok=True)
+        self.digests = self.read_json(f"{self.cache_path}/{self.DIGESTS}") or {}
+
+    def read_json(self, file: str) -> dict | None:
+        if not os.path.exists(file):
+            return None
+        with open(file, "r") as f:
+            return json.load(f)
+
+    def write_json(self, file: str, data: dict) -> None:
+        with open(f"{file}.tmp", "w") as f:
+            json.dump(data, f, indent=4)
+        os.replace(f"{file}.tmp", file)
+
+    def file_digest(self, file: str) -> str:
+        # the digest of every path is remembered with its size and mtime, an unchanged local file is not read again
+        stat = os.stat(file)
+        path = os.path.abspath(file)
+        if self.digests.get(path, [None, None])[:2] != [stat.st_size, stat.st_mtime_ns]:
+            with open(file, "rb") as f:
+                self.digests[path] = [stat.st_size, stat.st_mtime_ns, hashlib.file_digest(f, "blake2b").hexdigest()]
+        return self.digests[path][2]
+
+    def path_digest(self, path: str) -> str:
+        if os.path.isfile(path):
+            return self.file_digest(path)
+        if not os.path.isdir(path):
+            return "missing"
+
+        digest = hashlib.blake2b()
+        for file in sorted(glob.glob(f"{path}/**", recursive=True)):
+            if os.path.isfile(file):
+                digest.update(f"{os.path.relpath(file, path)}:{self.file_digest(file)}".encode())
+        return digest.hexdigest()
+
+    def fingerprint(self, inputs: dict, config: dict, code_path: str) -> str:
+        """Key of a step run: the content of every input, the config and the stage sources under `code_path`."""
+        digest = hashlib.blake2b(digest_size=16)
+        for name, path in sorted(inputs.items()):
+            digest.update(f"input:{name}:{self.path_digest(path)}".encode())
+        digest.update(f"config:{json.dumps(config, sort_keys=True, default=str)}".encode())
+        for source in sorted(glob.glob(f"{code_path}/*.py")):
+            digest.update(f"code:{os.path.basename(source)}:{self.file_digest(source)}".encode())
+
+        self.write_json(f"{self.cache_path}/{self.DIGESTS}", self.digests)
+        return digest.hexdigest()
+
+    def restore(self, key: str, roots: dict) -> bool:
+        """Copies the outputs of the entry back under their roots, False when the key has no entry."""
+        entry = f"{self.cache_path}/{key}"
+        manifest = self.read_json(f"{entry}/{self.ENTRY_MANIFEST}")
+        if manifest is None:
+            return False
+
+        for root, path in manifest["outputs"]:
+            target = f"{roots[root]}/{path}"
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+            elif os.path.exists(target):
+                os.remove(target)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if os.path.isdir(f"{entry}/{root}/{path}"):
+                shutil.copytree(f"{entry}/{root}/{path}", target)
+            else:
+                shutil.copy2(f"{entry}/{root}/{path}", target)
+
+        self.write_json(f"{entry}/{self.ENTRY_MANIFEST}", {**manifest, "last_used": time.time()})
+        return True
+
+    def store(self, key: str, roots: dict, outputs: list) -> None:
+        """Copies the `(root, path)` outputs of a run into the entry of its key, then evicts past the size limit."""
+        entry = f"{self.cache_path}/{key}"
+        if os.path.exists(entry):
+            return
+
+        # the entry is built aside and renamed in place, a run interrupted mid copy leaves no partial entry
+        staging = f"{self.cache_path}/.staging-{key}-{os.getpid()}"
+        outputs = list(dict.fromkeys(map(tuple, outputs)))
+        size = 0
+        for root, path in outputs:
+            source, target = f"{roots[root]}/{path}", f"{staging}/{root}/{path}"
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if os.path.isdir(source):
+                shutil.copytree(source, target)
+                size += sum(os.path.getsize(file) for file in glob.glob(f"{target}/**", recursive=True) if os.path.isfile(file))
+            else:
+                shutil.copy2(source, target)
+                size += os.path.getsize(target)
+
+        now = time.time()
+        self.write_json(f"{staging}/{self.ENTRY_MANIFEST}", {"outputs": outputs, "size": size, "created": now, "last_used": now})
+        os.replace(staging, entry)
+        self.evict()
+
+    def evict(self) -> None:
+        entries = []
+        for manifest_file in glob.glob(f"{self.cache_path}/*/{self.ENTRY_MANIFEST}"):
+            manifest = self.read_json(manifest_file)
+            entries.append((manifest["last_used"], manifest["size"], os.path.dirname(manifest_file)))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
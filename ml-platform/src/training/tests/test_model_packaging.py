@@ -0,0 +1,27 @@
+import tarfile
+import numpy as np
+from catboost import CatBoostRanker, Pool
+from fs_repository_interface import FileSystemRepository
+
+
+def fit_ranker():
+    random = np.random.default_rng(0)
+    pool = Pool(random.random((60, 3)), label=random.integers(0, 3, size=60), group_id=np.repeat(np.arange(6), 10))
+    return CatBoostRanker(iterations=5, loss_function="YetiRank", verbose=False, allow_writing_files=False).fit(pool), pool
+
+
+def test_packaging_bundles_only_the_models_of_the_run(tmp_path):
+    (tmp_path / "models").mkdir()
+    (tmp_path / "models" / "model-stale.cbm").write_bytes(b"from an earlier run")
+    repository = FileSystemRepository(str(tmp_path), str(tmp_path), str(tmp_path), str(tmp_path / "models"), model_packaging=True)
+
+    model, pool = fit_ranker()
+    predictions = model.predict(pool)
+    repository.save_models(model, "model-fresh")
+    # the caller keeps using the model while it is written
+    np.testing.assert_array_equal(model.predict(pool), predictions)
+    repository.finalize_models()
+
+    with tarfile.open(tmp_path / "models" / "model.tar.gz") as tar:
+        assert tar.getnames() == ["model-fresh.cbm"]
+    np.testing.assert_allclose(CatBoostRanker().load_model(str(tmp_path / "models" / "model-fresh.cbm")).predict(pool), predictions)
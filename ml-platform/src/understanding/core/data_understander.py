@@ -1,49 +1,147 @@
+import math
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plot
 from logging import Logger
 from kink import inject
 from sagemaker_repository_interface import SagemakerLocalRepository
-import matplotlib.pyplot as plot
-import fireducks.pandas as pd
-import seaborn as sns
+from profiler import Profiler
+from sketches import CategoryCounts, CorrelationSketch, QuantileSketch
 
 @inject()
 class DataUnderstander:
-	def __init__(self, repository: SagemakerLocalRepository, logger: Logger):
+	id_columns = ['itemid', 'visitorid']
+	categorical_columns = ['category']
+	quantiles = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+	relative_accuracy = 0.01
+	histogram_bins = 50
+	top_categories = 20
+	report_path = 'understanding'
+
+	def __init__(self, repository: SagemakerLocalRepository, logger: Logger, profiler: Profiler, understanding_dataset: str = 'final_items_dataset.csv', understanding_chunk_size: int = 100000):
 		self.data_repository = repository
 		self.logger = logger
-	
-	def understand(self):
-		self.logger.info(f"Starting data Understanding...")
-		df_items = self.data_repository.read('final_items_dataset.csv')
+		self.profiler = profiler
+		self.dataset = understanding_dataset
+		self.chunk_size = understanding_chunk_size
+
+	def get_columns(self, chunk):
+		columns = [column for column in chunk.columns if column not in self.id_columns]
+		categorical = [column for column in columns if column in self.categorical_columns or chunk[column].dtype.kind not in 'biuf']
+		return [column for column in columns if column not in categorical], categorical
 
-		# for i in list(final_dataset.dtypes[final_dataset.dtypes!=object].index):
-		# 	self.logger.info(f"Creating boxplot for: {i}")
-		# 	sns.boxplot(data=final_dataset,x=i,orient='v')
-		# 	plot.show()
+	def sketch(self, chunk, numeric, categorical):
+		"""Sketches of one chunk, merged into the ones of the previous chunks."""
+		return {
+			'quantiles': {column: QuantileSketch(self.relative_accuracy).add(chunk[column].to_numpy(dtype='float64', na_value=np.nan)) for column in numeric},
+			'categories': {column: CategoryCounts().add(chunk[column].to_numpy()) for column in categorical},
+			'correlation': CorrelationSketch(numeric).add(chunk[numeric].to_numpy(dtype='float64', na_value=np.nan)),
+		}
 
+	def merge(self, sketches, chunk_sketches):
+		if sketches is None:
+			return chunk_sketches
+		for kind in ('quantiles', 'categories'):
+			for column, sketch in chunk_sketches[kind].items():
+				sketches[kind][column].merge(sketch)
+		sketches['correlation'].merge(chunk_sketches['correlation'])
+		return sketches
 
+	def summarize(self, sketches, rows):
+		correlation = sketches['correlation'].correlation()
+		columns = sketches['correlation'].columns
+		return {
+			'dataset': self.dataset,
+			'rows': rows,
+			'relative_accuracy': self.relative_accuracy,
+			'numeric': {
+				column: {
+					'count': sketch.count,
+					'missing': sketch.missing,
+					'min': sketch.min if sketch.count else None,
+					'max': sketch.max if sketch.count else None,
+					'quantiles': {str(q): sketch.quantile(q) for q in self.quantiles},
+				}
+				for column, sketch in sketches['quantiles'].items()
+			},
+			'categorical': {
+				column: {'distinct': len(sketch.counts), 'top': dict(sketch.top(self.top_categories))}
+				for column, sketch in sketches['categories'].items()
+			},
+			'correlation': {
+				'rows': sketches['correlation'].count,
+				'matrix': {
+					column: {other: None if math.isnan(value) else float(value) for other, value in zip(columns, correlation[index])}
+					for index, column in enumerate(columns)
+				},
+			},
+		}
 
-		# for i in list(final_dataset.dtypes[final_dataset.dtypes!=object].index):
-		# 	self.logger.info(f"Creating histogram for: {i}")
-		# 	sns.histplot(final_dataset[i], kde=True, stat="density")
-		# 	plot.show()	
+	def plot_histograms(self, sketches):
+		columns = list(sketches['quantiles'])
+		if not columns:
+			return
+		rows = math.ceil(len(columns) / 4)
+		figure, axes = plot.subplots(rows, 4, figsize=(16, 3.5 * rows), squeeze=False)
+		for axis, column in zip(axes.flat, columns):
+			counts, edges = sketches['quantiles'][column].histogram(self.histogram_bins)
+			axis.stairs(counts, edges, fill=True)
+			axis.set_title(column)
+		for axis in axes.flat[len(columns):]:
+			axis.set_visible(False)
+		self.data_repository.save_figure(figure, f'{self.report_path}/histograms.png')
+		plot.close(figure)
 
-		# self.logger.info(f"Creating correlation matrix")
-		corr = df_items.corr(numeric_only=True)
-		self.logger.info(f"Correlation Matrix: \n{corr}")
-		sns.heatmap(corr, annot=True, fmt=".2f", cmap='coolwarm')
-		plot.show()
+	def plot_correlation(self, sketches):
+		columns = sketches['correlation'].columns
+		if not columns:
+			return
+		correlation = sketches['correlation'].correlation()
+		figure, axis = plot.subplots(figsize=(2 + len(columns), 1 + len(columns)))
+		image = axis.imshow(correlation, cmap='coolwarm', vmin=-1, vmax=1)
+		axis.set_xticks(range(len(columns)), columns, rotation=90)
+		axis.set_yticks(range(len(columns)), columns)
+		for (row, column), value in np.ndenumerate(correlation):
+			axis.text(column, row, f"{value:.2f}", ha='center', va='center', fontsize=8)
+		figure.colorbar(image, ax=axis)
+		self.data_repository.save_figure(figure, f'{self.report_path}/correlation.png')
+		plot.close(figure)
 
+	def plot_categories(self, sketches):
+		for column, sketch in sketches['categories'].items():
+			top = sketch.top(self.top_categories)
+			figure, axis = plot.subplots(figsize=(8, 1 + len(top) / 3))
+			axis.barh([key for key, _ in reversed(top)], [count for _, count in reversed(top)])
+			axis.set_title(f"Top {len(top)} of {len(sketch.counts)} {column} values")
+			self.data_repository.save_figure(figure, f'{self.report_path}/{column}_counts.png')
+			plot.close(figure)
 
-		self.logger.info(f"Creating pairplot")
-		sns.pairplot(data=df_items.head(100000), hue='views', diag_kind='kde')
-		plot.show()
+	def understand(self):
+		self.logger.info(f"Starting data Understanding of {self.dataset}...")
 
+		# a single pass over the dataset, every chunk only updates mergeable sketches
+		sketches, rows, numeric, categorical = None, 0, None, None
+		for chunk in self.data_repository.read_chunks(self.dataset, self.chunk_size):
+			if numeric is None:
+				numeric, categorical = self.get_columns(chunk)
+			with self.profiler.span("sketch", len(chunk)):
+				sketches = self.merge(sketches, self.sketch(chunk, numeric, categorical))
+			rows += len(chunk)
+			self.logger.debug(f"Sketched {rows} rows")
 
-		# for i in df_full_items.columns:
-		# 	sns.scatterplot(data=df_full_items,x=i,y='category', hue='views')
-		# 	plot.show()
+		if sketches is None:
+			self.logger.warning(f"{self.dataset} is empty, nothing to understand")
+			return
 
-		self.logger.info(f"Data Understanding Finished")
+		summary = self.summarize(sketches, rows)
+		self.data_repository.save_report(summary, f'{self.report_path}/summary.json')
+		self.logger.info(f"Correlation over {summary['correlation']['rows']} complete rows of {rows}")
+		self.logger.debug("Summary: \n%s", summary)
 
-		input("Press Enter to continue...")
+		with self.profiler.span("plots"):
+			self.plot_histograms(sketches)
+			self.plot_correlation(sketches)
+			self.plot_categories(sketches)
 
+		self.logger.info(f"Data Understanding Finished, report under {self.report_path}")
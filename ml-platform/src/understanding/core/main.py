@@ -6,19 +6,29 @@ from logging import Logger
 from data_understander import DataUnderstander
 from sagemaker_repository_interface import SagemakerLocalRepository
 from logger import LoggerFactory
+from profiler import Profiler
 
 LOGLEVEL = os.getenv('LOGLEVEL')
 MODE = os.getenv('MODE')
+STORAGE_FORMAT = os.getenv('STORAGE_FORMAT')
+DATA_PATH = os.getenv('DATA_PATH')
+UNDERSTANDING_DATASET = os.getenv('UNDERSTANDING_DATASET')
+UNDERSTANDING_CHUNK_SIZE = os.getenv('UNDERSTANDING_CHUNK_SIZE')
 
 di[Logger] = LoggerFactory.create_logger(LOGLEVEL or "INFO")
-di["SagemakerLocalInputPath"] = '/opt/ml/processing/input/data'
-di["SagemakerLocalOutputPath"] = '/opt/ml/processing/output/data'
+di[Profiler] = Profiler("understanding")
+di["SagemakerLocalInputPath"] = f"{DATA_PATH}/input" if DATA_PATH else '/opt/ml/processing/input/data'
+di["SagemakerLocalOutputPath"] = DATA_PATH or '/opt/ml/processing/output/data'
+di["understanding_dataset"] = UNDERSTANDING_DATASET or 'final_items_dataset.csv'
+di["understanding_chunk_size"] = int(UNDERSTANDING_CHUNK_SIZE or 100000)
 
 di[SagemakerLocalRepository] = SagemakerLocalRepository(
     di["SagemakerLocalInputPath"],
     di["SagemakerLocalOutputPath"],
-    MODE == "DEVELOPMENT"
+    MODE == "DEVELOPMENT",
+    STORAGE_FORMAT or "parquet"
 )
+di[Profiler].instrument(di[SagemakerLocalRepository], prefix="repository")
 
 def main():
     try:
@@ -27,6 +37,8 @@ def main():
     except Exception as e:
         print(e)
         raise e
+    finally:
+        di[Profiler].save(f"{di['SagemakerLocalOutputPath']}/metrics")
 
 
 if __name__ == "__main__":
@@ -1,17 +1,41 @@
-from logging import Logger
+import json
+import os
 import fireducks.pandas as pd
 from kink import inject
+from typing import Iterator
+from dataset_schema import resolve_schema
+from storage_format import resolve_storage_format
 
 @inject()
 class SagemakerLocalRepository():
-    def __init__(self, input_path: str, output_path: str, analysis: bool = False) -> None:
+    def __init__(self, input_path: str, output_path: str, analysis: bool = False, storage_format: str = "parquet") -> None:
         self.input_path = input_path
         self.output_path = output_path
         self.analysis = analysis
+        self.storage_format = storage_format
 
     def save(self, data: pd.DataFrame, path: str, index: bool = False, force: bool = False) -> None:
         if self.analysis or force:
-            data.to_csv(f'{self.output_path}/{path}', index=index)
+            data = resolve_schema(path).apply(data.reset_index() if index else data, strict=True)
+            path, storage_format = resolve_storage_format(path, self.storage_format)
+            storage_format.write(data, f'{self.output_path}/{path}', index=False)
 
-    def read(self, path: str) -> pd.DataFrame:
-        return pd.read_csv(f'{self.input_path}/{path}')
+    def read(self, path: str, columns: list | None = None, filters: list | None = None) -> pd.DataFrame:
+        schema = resolve_schema(path)
+        path, storage_format = resolve_storage_format(path, self.storage_format)
+        return schema.apply(storage_format.read(f'{self.input_path}/{path}', columns=columns, filters=filters, dtypes=schema.dtypes))
+
+    def read_chunks(self, path: str, chunksize: int, columns: list | None = None) -> Iterator[pd.DataFrame]:
+        schema = resolve_schema(path)
+        path, storage_format = resolve_storage_format(path, self.storage_format)
+        chunks = storage_format.read_chunks(f'{self.input_path}/{path}', chunksize, columns=columns, dtypes=schema.dtypes)
+        return (schema.apply(chunk) for chunk in chunks)
+
+    def save_report(self, report: dict, path: str) -> None:
+        os.makedirs(os.path.dirname(f'{self.output_path}/{path}'), exist_ok=True)
+        with open(f'{self.output_path}/{path}', 'w') as outfile:
+            outfile.write(json.dumps(report, indent=4))
+
+    def save_figure(self, figure, path: str) -> None:
+        os.makedirs(os.path.dirname(f'{self.output_path}/{path}'), exist_ok=True)
+        figure.savefig(f'{self.output_path}/{path}', dpi=100, bbox_inches='tight')
@@ -0,0 +1,144 @@
+import math
+import numpy as np
+
+
+class QuantileSketch:
+    """Relative error quantile sketch (DDSketch) of a numeric column.
+
+    Values are counted in logarithmic buckets, so every quantile is returned within `relative_accuracy` of
+    the true value whatever the size of the stream, and two sketches merge by adding their bucket counts.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01) -> None:
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zeros = 0
+        self.count = 0
+        self.missing = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, values) -> "QuantileSketch":
+        values = np.asarray(values, dtype=np.float64)
+        present = values[~np.isnan(values)]
+        self.missing += len(values) - len(present)
+        if not len(present):
+            return self
+
+        self.count += len(present)
+        self.min = min(self.min, float(present.min()))
+        self.max = max(self.max, float(present.max()))
+        self.zeros += int((present == 0).sum())
+        for store, side in ((self.positive, present[present > 0]), (self.negative, -present[present < 0])):
+            keys, counts = np.unique(np.ceil(np.log(side) / self.log_gamma).astype(np.int64), return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                store[key] = store.get(key, 0) + count
+        return self
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Only sketches of the same relative accuracy can be merged")
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, count in other_store.items():
+                store[key] = store.get(key, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        self.missing += other.missing
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def buckets(self) -> tuple[np.ndarray, np.ndarray]:
+        """Value and count of every bucket in increasing order, the value of a bucket is within the accuracy of all of its values."""
+        negative = sorted(self.negative, reverse=True)
+        positive = sorted(self.positive)
+        values = np.r_[
+            [-2 * self.gamma ** key / (self.gamma + 1) for key in negative],
+            [0.0] if self.zeros else [],
+            [2 * self.gamma ** key / (self.gamma + 1) for key in positive],
+        ]
+        counts = np.r_[[self.negative[key] for key in negative], [self.zeros] if self.zeros else [], [self.positive[key] for key in positive]]
+        return values, counts
+
+    def quantile(self, q: float) -> float | None:
+        if not self.count:
+            return None
+        values, counts = self.buckets()
+        index = np.searchsorted(np.cumsum(counts), q * (self.count - 1), side="right")
+        return float(np.clip(values[index], self.min, self.max))
+
+    def histogram(self, bins: int = 50) -> tuple[np.ndarray, np.ndarray]:
+        """Counts over `bins` equal width bins from min to max, every bucket counted in the bin of its value."""
+        if not self.count:
+            return np.array([]), np.array([])
+        values, counts = self.buckets()
+        counts, edges = np.histogram(np.clip(values, self.min, self.max), bins=bins, range=(self.min, self.max), weights=counts)
+        return counts, edges
+
+
+class CategoryCounts:
+    """Exact count of every value of a categorical column, merged by adding the counts."""
+
+    def __init__(self) -> None:
+        self.counts = {}
+
+    def add(self, values) -> "CategoryCounts":
+        keys, counts = np.unique(np.asarray(values).astype(str), return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            self.counts[key] = self.counts.get(key, 0) + count
+        return self
+
+    def merge(self, other: "CategoryCounts") -> "CategoryCounts":
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+        return self
+
+    def top(self, count: int) -> list:
+        return sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))[:count]
+
+
+class CorrelationSketch:
+    """Pearson correlation of numeric columns from their count, means and co-moment matrix.
+
+    Rows with a missing value are left out. Partial sketches merge with the pairwise update of Chan et al., so
+    the result does not depend on how the stream was chunked.
+    """
+
+    def __init__(self, columns: list) -> None:
+        self.columns = columns
+        self.count = 0
+        self.mean = np.zeros(len(columns))
+        self.comoment = np.zeros((len(columns), len(columns)))
+
+    def add(self, values) -> "CorrelationSketch":
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values).any(axis=1)]
+        if not len(values):
+            return self
+
+        chunk = CorrelationSketch(self.columns)
+        chunk.count = len(values)
+        chunk.mean = values.mean(axis=0)
+        centered = values - chunk.mean
+        chunk.comoment = centered.T @ centered
+        return self.merge(chunk)
+
+    def merge(self, other: "CorrelationSketch") -> "CorrelationSketch":
+        if not other.count:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.comoment = self.comoment + other.comoment + np.outer(delta, delta) * self.count * other.count / count
+        self.mean = self.mean + delta * other.count / count
+        self.count = count
+        return self
+
+    def correlation(self) -> np.ndarray:
+        deviations = np.sqrt(np.diag(self.comoment))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            correlation = self.comoment / np.outer(deviations, deviations)
+        # constant columns have no correlation, as in pandas
+        return np.where(np.outer(deviations, deviations) > 0, correlation, np.nan)
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sketches import CategoryCounts, CorrelationSketch, QuantileSketch
+
+QUANTILES = [0, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 1]
+
+
+def make_values(size=20000, seed=5):
+    random = np.random.default_rng(seed)
+    # heavy tailed positives, negatives, exact zeros and missing values
+    values = np.r_[random.lognormal(8, 2, size // 2), -random.lognormal(2, 1, size // 4), np.zeros(size // 8), np.full(size // 8, np.nan)]
+    return random.permutation(values)
+
+
+def sketch_of(chunks, relative_accuracy=0.01):
+    sketch = QuantileSketch(relative_accuracy)
+    for chunk in chunks:
+        sketch.merge(QuantileSketch(relative_accuracy).add(chunk))
+    return sketch
+
+
+@pytest.mark.parametrize("relative_accuracy", [0.01, 0.05])
+def test_quantiles_are_within_the_relative_accuracy(relative_accuracy):
+    values = make_values()
+    present = np.sort(values[~np.isnan(values)])
+    sketch = QuantileSketch(relative_accuracy).add(values)
+
+    assert sketch.count == len(present) and sketch.missing == np.isnan(values).sum()
+    for q in QUANTILES:
+        # the rank DDSketch answers for, the lower of the two closest ranks
+        expected = present[int(np.floor(q * (len(present) - 1)))]
+        assert abs(sketch.quantile(q) - expected) <= relative_accuracy * abs(expected) + 1e-12, q
+
+
+def test_merge_is_associative_and_chunking_independent():
+    values = make_values()
+    chunks = np.array_split(values, 7)
+    whole = QuantileSketch().add(values)
+    left = sketch_of(chunks[:3]).merge(sketch_of(chunks[3:]))
+    right = sketch_of(chunks[:5]).merge(sketch_of(chunks[5:]))
+    reordered = sketch_of(chunks[::-1])
+
+    for sketch in (left, right, reordered):
+        assert (sketch.positive, sketch.negative, sketch.zeros, sketch.count, sketch.missing, sketch.min, sketch.max) == \
+            (whole.positive, whole.negative, whole.zeros, whole.count, whole.missing, whole.min, whole.max)
+        assert [sketch.quantile(q) for q in QUANTILES] == [whole.quantile(q) for q in QUANTILES]
+
+
+def test_merges_of_different_accuracies_are_rejected():
+    with pytest.raises(ValueError):
+        QuantileSketch(0.01).merge(QuantileSketch(0.02))
+
+
+def test_category_counts_are_exact():
+    random = np.random.default_rng(6)
+    values = random.choice([1338, 9, 250, 1113], size=5000)
+    counts = CategoryCounts()
+    for chunk in np.array_split(values, 9):
+        counts.merge(CategoryCounts().add(chunk))
+
+    assert counts.counts == {str(value): int(count) for value, count in zip(*np.unique(values, return_counts=True))}
+
+
+def test_streaming_correlation_matches_pandas():
+    random = np.random.default_rng(7)
+    base = random.normal(size=6000)
+    df = pd.DataFrame({"a": base, "b": base * 2 + random.normal(size=6000), "c": random.normal(size=6000), "constant": 1.0})
+    df.loc[random.choice(6000, 300), "b"] = np.nan
+
+    sketch = CorrelationSketch(list(df.columns))
+    for chunk in np.array_split(df.to_numpy(), 11):
+        sketch.merge(CorrelationSketch(list(df.columns)).add(chunk))
+
+    # rows with a missing value are left out of every pair, pandas is given the same rows
+    np.testing.assert_allclose(sketch.correlation(), df.dropna().corr().to_numpy(), atol=1e-12, equal_nan=True)